@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+from pathlib import Path
+import threading
+from typing import Any
+
+from core.config import _config
+from core.logger import _logger
+from core.startup import lazy_import
+
+PIL = lazy_import("PIL.Image")
+cv2 = lazy_import("cv2")
+
+# formati prodotti accanto ai fogli
+ANIMATION_FORMATS = ("gif", "mp4")
+
+
+def _boomerang(frames: list[Any]) -> list[Any]:
+    return frames + frames[-2:0:-1]
+
+
+def _encode_gif(frames: list[Any], output: Path, fps: int, colors: int) -> None:
+    images = [PIL.Image.fromarray(cv2.cvtColor(f, cv2.COLOR_BGR2RGB)) for f in frames]
+    # una sola palette per sessione, calcolata sul fotogramma centrale
+    palette = images[len(images) // 2].quantize(colors)
+    quantized = [
+        image.quantize(palette=palette, dither=PIL.Image.Dither.NONE) for image in images
+    ]
+    quantized[0].save(
+        output,
+        save_all=True,
+        append_images=quantized[1:],
+        duration=int(1000 / fps),
+        loop=0,
+    )
+
+
+def _encode_mp4(frames: list[Any], output: Path, fps: int) -> None:
+    h, w = frames[0].shape[:2]
+    writer = cv2.VideoWriter(str(output), cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+    try:
+        for frame in frames:
+            writer.write(frame)
+    finally:
+        writer.release()
+
+
+def _encode(frames: list[Any], output: Path, fps: int, colors: int) -> Path:
+    # eseguita nel processo encoder
+    frames = _boomerang(frames)
+    if output.suffix == ".mp4":
+        _encode_mp4(frames, output, fps)
+    else:
+        _encode_gif(frames, output, fps, colors)
+    return output
+
+
+class AnimationEncoder:
+    """Codifica le animazioni "boomerang" delle sessioni in un processo separato.
+
+    La coda dei lavori è limitata: se è piena l'animazione viene scartata,
+    così la codifica non può mai rallentare il photobooth.
+    """
+
+    def __init__(
+        self,
+        extension: str = _config.get("photo.animation.format", "gif"),
+        fps: int = _config.get("photo.animation.fps", 12),
+        colors: int = _config.get("photo.animation.colors", 128),
+        max_pending: int = _config.get("photo.animation.max_pending", 2),
+    ) -> None:
+        self._extension = extension
+        self._fps = fps
+        self._colors = colors
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # spawn: il processo figlio non eredita i thread e il display del padre
+        self._pool = ProcessPoolExecutor(
+            1, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def submit(self, frames: list[Any], sheet: Path) -> Future | None:
+        """Accoda la codifica; l'animazione viene salvata accanto al foglio."""
+        if not frames:
+            return None
+        if not self._slots.acquire(blocking=False):
+            _logger.warning(f"Animation queue full, skipping animation for {sheet}")
+            return None
+        output = Path(sheet).with_suffix(f".{self._extension}")
+        future = self._pool.submit(_encode, frames, output, self._fps, self._colors)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future) -> None:
+        self._slots.release()
+        if future.cancelled():
+            return
+        if e := future.exception():
+            _logger.warning(f"Animation encoding failed: {e}")
+        else:
+            _logger.debug(f"Animation saved: {future.result()}")
+
+    def stop(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
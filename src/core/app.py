@@ -1,17 +1,44 @@
+from __future__ import annotations
+
 import argparse
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import functools
 from pathlib import Path
 from enum import Enum
 import asyncio
-
-import PIL.Image
+import signal
+import time
+import tomllib
+from typing import Any, Callable, Coroutine
 
 from core.config import _config
-from core.logger import _logger
+from core.exceptions import ConfigurationError
+from core.logger import _logger, stop_logging, use_rich_console
+from core.startup import _startup_report
+from core.animation import AnimationEncoder
+from core.assets import AssetRegistry
+from core.booth import Booth, BoothServices
+from core.catalog import PhotoCatalog
+from core.filters import ColorGrader, benchmark as benchmark_looks
+from core.gallery import GalleryServer
+from core.journal import SessionJournal
+from core.layout import LayoutRegistry
+from core.print_queue import PrintQueue
+from core.reprint import Reprinter
+from core.replay import (
+    ReplayBoard,
+    ReplayDriver,
+    ReplayHarness,
+    ReplayPrinter,
+    SyntheticCapture,
+)
+from core.retention import RetentionManager
+from core.thumbnails import ThumbnailCache
 from core.manager.camera_manager import CameraManager
 from core.manager.printer_manager import PrinterManager
-from core.manager.gui_manager import GuiManager, pg
+from core.manager.gui_manager import GuiManager, add_hotkey
 from core.manager.board_manager import BoardManager, Module
-from core.image_utils import merge_pics, pil_to_pygame, save_pic, cm_to_px
+from core.storage import PhotoStorage
 
 
 class _Mode(Enum):
@@ -27,6 +54,25 @@ class _App:
     def __init__(self, args: argparse.Namespace) -> None:
         self.args = args
 
+    def _booths_config(self, camera: int) -> list[dict[str, Any]]:
+        # senza tabelle [[booths]] c'è una sola postazione con le impostazioni predefinite
+        booths = _config.get("booths") or [{}]
+        if self.args.replay:
+            # replay: postazioni affiancate, una per sessione contemporanea
+            count = max(1, _config.get("replay.concurrency", 1))
+            booths = [
+                {"camera": i, "region": (i / count, 0, 1 / count, 1)} for i in range(count)
+            ]
+        return [
+            {
+                "name": booth.get("name", f"booth{i + 1}"),
+                "camera": booth.get("camera", camera),
+                "pins": booth.get("pins", "io.pins"),
+                "region": tuple(booth.get("region", (0, 0, 1, 1))),
+            }
+            for i, booth in enumerate(booths)
+        ]
+
     def _init(self) -> None:
         mode = _Mode(int(self.args.mode) if self.args.mode else _config.get("app.mode"))
         name = self.args.name if self.args.name else _config.get("app.name")
@@ -41,6 +87,25 @@ class _App:
             if self.args.camera
             else _config.get("usb.camera.default")
         )
+        booths = self._booths_config(camera)
+        replay = ReplayDriver(int(self.args.replay)) if self.args.replay else None
+        camera_factory, board_factory = CameraManager, BoardManager
+        printer_factory = PrinterManager
+        folders = {
+            key: Path(_config.get(f"paths.folders.{key}"))
+            for key in ("photos", "thumbnails", "archive", "data")
+        }
+        replay_dir: Path | None = None
+        if replay:
+            # stessa pipeline, ma fotogrammi e gettoni arrivano dal driver
+            camera_factory = functools.partial(CameraManager, capture=SyntheticCapture)
+            board_factory = functools.partial(ReplayBoard, driver=replay)
+            printer_factory = ReplayPrinter
+            # foto, catalogo e journal del replay non si mescolano a quelli dell'evento
+            replay_dir = Path(_config.get("paths.folders.logs", "logs")) / (
+                f"replay_{time.strftime('%Y%m%d_%H%M%S')}"
+            )
+            folders = {key: replay_dir / key for key in folders}
 
         _logger.info(
             f"{_config.get('app.name')} application v-{_config.get('app.version')} setup as {mode.name.lower()} ({int(mode.value)}) mode"
@@ -51,96 +116,202 @@ class _App:
             _logger.setLevel("DEBUG")
 
         _logger.info("Initializing gui manager")
-        self._gui: GuiManager = GuiManager(name, fullscreen, deferred)
-        self._gui.show_init_screen()
-
-        _logger.info("Initializing camera manager")
-        self._camera: CameraManager = CameraManager(camera)
+        with _startup_report.phase("gui"):
+            # una sola cache delle immagini; ogni postazione ha la sua area del display
+            self._assets = AssetRegistry()
+            guis = [
+                GuiManager(name, fullscreen, deferred, self._assets, booth["region"])
+                for booth in booths
+            ]
+            for gui in guis:
+                gui.show_init_screen()
 
-        _logger.info("Initializing printer manager")
-        self._printer: PrinterManager = PrinterManager()
+        # i sottosistemi lenti partono insieme mentre la schermata di avvio è visibile
+        with ThreadPoolExecutor(thread_name_prefix="Init") as pool:
+            cameras_init = [
+                self._init_subsystem(
+                    pool, f"camera {booth['name']}", camera_factory, booth["camera"]
+                )
+                for booth in booths
+            ]
+            boards_init = [
+                self._init_subsystem(
+                    pool, f"board {booth['name']}", board_factory, self._pins(booth["pins"])
+                )
+                for booth in booths
+            ]
+            printer_init = self._init_subsystem(pool, "printer", printer_factory)
+            assets_init = self._init_subsystem(pool, "assets", guis[0].preload_images)
+            catalog_init = self._init_subsystem(
+                pool,
+                "catalog",
+                PhotoCatalog,
+                folders["data"] / _config.get("catalog.file"),
+            )
+            pending = {*cameras_init, *boards_init, printer_init, assets_init, catalog_init}
+            while pending:
+                _, pending = wait(pending, timeout=0.05)
+                guis[0].pump_events()
 
-        _logger.info("Initializing board manager")
-        pins_data = [
-            Module(module, *_config.get(f"io.pins.{module}").values())
-            for module in _config.get("io.pins")
-        ]
-        self._board: BoardManager = BoardManager(pins_data)
-        photos_dir = Path(_config.get("paths.folders.photos"))
-        if not photos_dir.exists():
-            _logger.info("Creating missing directories")
-            photos_dir.mkdir(parents=True, exist_ok=True)
-
-    def prepare_final_pic(self) -> tuple[PIL.Image.Image, Path]:
-        watermark_path = Path(_config.get("paths.folders.images")) / Path(
-            _config.get_path("watermark")
-        )
-        pics = [PIL.Image.open(str(watermark_path.resolve()))]
-        pics.extend([self._camera.pop_pic() for _ in range(_config.get("photo.count"))])
-        format_size = self._printer.get_sheet_format_size(
-            _config.get("usb.printer.sheet_format")
-        )
-        dpi = _config.get("usb.printer.dpi")
-        format_size = cm_to_px(format_size, dpi)[::-1]
-        margins = cm_to_px(_config.get("usb.printer.sheet_margins"), dpi)
-        spacing = cm_to_px([_config.get("usb.printer.pics_spacing")], dpi)[0]
-        pics_per_row = _config.get("usb.printer.pics_per_row")
-        merged = merge_pics(format_size, pics, margins, spacing, pics_per_row)
-        return merged, save_pic(
-            merged,
-            _config.get("paths.folders.photos"),
+        self._printer: PrinterManager = printer_init.result()
+        self._catalog: PhotoCatalog = catalog_init.result()
+        assets_init.result()
+        with _startup_report.phase("screens"):
+            for gui in guis:
+                gui.prerender_screens()
+        self._storage = PhotoStorage(
+            folders["photos"],
             _config.get("photo.prefix"),
             _config.get("photo.extension"),
         )
+        self._thumbnails = ThumbnailCache(folders["thumbnails"], self._storage.root)
+        data = folders["data"]
+        self._journal = SessionJournal(
+            data / _config.get("journal.file", "journal.jsonl"),
+            data / _config.get("journal.frames_folder", "sessions"),
+        )
+        self._interrupted = self._journal.recover()
+        self._print_queue = PrintQueue(self._printer, self._catalog, self._journal)
+        self._reprinter = Reprinter(self._catalog, self._print_queue)
+        self._gallery: GalleryServer | None = None
+        if _config.get("gallery.enabled", False) and not replay:
+            self._gallery = GalleryServer(self._catalog, self._thumbnails, self._reprinter)
+            self._gallery.start()
+        self._retention = RetentionManager(
+            self._storage,
+            folders["archive"],
+            self._thumbnails,
+            self._catalog,
+        )
+        self._retention.start()
+        self._animations: AnimationEncoder | None = None
+        if _config.get("photo.animation.enabled", False):
+            self._animations = AnimationEncoder()
+        self._compositor = ThreadPoolExecutor(
+            _config.get("photo.compose_workers", 2), thread_name_prefix="Compositor"
+        )
+        self._services = BoothServices(
+            self._catalog,
+            self._storage,
+            self._printer,
+            self._print_queue,
+            self._compositor,
+            ColorGrader(),
+            self._thumbnails if self._gallery else None,
+            self._animations,
+            self._retention,
+            self._journal,
+            LayoutRegistry(),
+        )
+        self._booths = [
+            Booth(
+                booth["name"],
+                gui,
+                camera_init.result(),
+                board_init.result(),
+                booth["pins"],
+                self._services,
+                mode == _Mode.DEBUG,
+                self._report_startup,
+            )
+            for booth, gui, camera_init, board_init in zip(
+                booths, guis, cameras_init, boards_init
+            )
+        ]
+        # ristampa dell'ultimo foglio, per l'operatore
+        add_hotkey(
+            _config.get("reprint.hotkey", "ctrl+shift+p"),
+            lambda: self._reprinter.schedule(self._reprinter.latest()),
+        )
+        add_hotkey(_config.get("reload.hotkey", "ctrl+shift+r"), self._reload_config)
+        self._replay: ReplayHarness | None = None
+        if replay:
+            self._replay = ReplayHarness(self._catalog, replay, report_dir=replay_dir)
+        if self.args.benchmark_looks:
+            shape = self._booths[0].camera.frame_shape
+            if 0 in shape:
+                shape = (1080, 1920, 3)
+            _logger.info(f"Looks benchmark on {shape} frames (ms): {benchmark_looks(shape)}")
+
+    def _pins(self, key: str) -> list[Module]:
+        return [
+            Module(module, *_config.get(f"{key}.{module}").values())
+            for module in _config.get(key)
+        ]
+
+    def _init_subsystem(
+        self, pool: ThreadPoolExecutor, name: str, factory: Callable, *args
+    ) -> Future:
+        def init() -> Any:
+            _logger.info(f"Initializing {name}")
+            with _startup_report.phase(name):
+                return factory(*args)
+
+        return pool.submit(init)
+
+    def _recover(self) -> list[Coroutine]:
+        """Sessioni interrotte dall'ultima chiusura: si stampano o si riaccredita il gettone."""
+        booths = {booth.name: booth for booth in self._booths}
+        count = _config.get("photo.count")
+        resumes = []
+        for session in self._interrupted:
+            booth = booths.get(session.booth, self._booths[0])
+            if session.resumable(count):
+                resumes.append(booth.resume(session))
+            else:
+                booth.credit(session.id)
+        return resumes
+
+    def _reload_config(self) -> None:
+        """Rilegge config.toml; schermate statiche e modelli del foglio vengono rigenerati."""
+        try:
+            _config.reload()
+        except (ConfigurationError, OSError, tomllib.TOMLDecodeError) as e:
+            # si continua con la configurazione precedente
+            _logger.error(f"Config not reloaded: {e}")
+            return
+        _logger.info(f"Config reloaded (version {_config.version})")
+
+    def _report_startup(self) -> None:
+        if _startup_report.mark("token screen"):
+            # prima schermata pronta: la console può passare a `rich`
+            use_rich_console()
+            if self.args.startup_report:
+                print(_startup_report.render())
 
     def stop(self) -> None:
         _logger.info("Closing application")
-        self._board.stop()
-        self._gui.stop()
-
-    def wait_module(self, pin: int) -> bool:
-        while True:
-            if self._mode == _Mode.DEBUG:
-                if self._gui.is_pressed(pg.K_k):
-                    _logger.info("Skip stage")
-                    return True
-            if self._board.get_pin_state(pin):
-                _logger.info("A token has been registered")
-                return True
-            if self._gui.request_to_stop():
-                _logger.info("A request to stop has been registered")
-                return False
+        for booth in self._booths:
+            booth.stop()
+        self._compositor.shutdown(wait=False, cancel_futures=True)
+        self._journal.stop()
+        self._assets.stop()
+        self._retention.stop()
+        if self._animations:
+            self._animations.stop()
+        if self._gallery:
+            self._gallery.stop()
+        self._thumbnails.stop()
+        self._catalog.stop()
+        stop_logging()
 
     def start(self) -> None:
         asyncio.run(self.run())
 
     async def run(self) -> None:
         self._init()
-        _logger.info("Application started")
-        pics_count: int = _config.get("photo.count")
-        while True:
-            # mostro schermata attesa gettone
-            self._gui.show_token_screen()
-            # aspetto inserimento gettone
-            if not self.wait_module(_config.get("io.pins.microswitch.pin")):
-                break
-            # mostro schermata attesa pressione pulsante
-            self._gui.show_button_screen()
-            # aspetto pressione pulsante
-            if not self.wait_module(_config.get("io.pins.button.pin")):
-                break
-            # avvio sequenza foto
-            for i in range(1, pics_count + 1):
-                _logger.info(f"Processing photo {i}/{pics_count}")
-                self._gui.show_countdown_screen(i)
-                self._camera.take_pic()
-            # unisco le foto
-            pic, pic_path = self.prepare_final_pic()
-            # mostro schermata stampa in corso con riepilogo foto
-            self._gui.show_print_preview(pil_to_pygame(pic))
-            # avvio stampa foto e attendo il termine
-            await self._printer.send_print_request(pic_path)
-            # mostro schermata di saluti (fine)
+        _logger.info(f"Application started with {len(self._booths)} booth(s)")
+        loop = asyncio.get_running_loop()
+        self._reprinter.bind(loop)
+        if hasattr(signal, "SIGHUP"):
+            # `kill -HUP` dopo aver modificato la configurazione
+            loop.add_signal_handler(signal.SIGHUP, self._reload_config)
+        if self._replay:
+            self._replay.start()
+        # ESC/chiusura arrivano a tutte le postazioni, che terminano insieme
+        await asyncio.gather(*(booth.run() for booth in self._booths), *self._recover())
+        if self._replay:
+            self._replay.stop()
         self.stop()
 
 
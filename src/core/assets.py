@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+import threading
+from typing import Iterable
+
+from core.config import _config
+from core.exceptions import ConfigLookupError
+from core.logger import _logger
+from core.startup import lazy_import
+
+pg = lazy_import("pygame")
+
+
+def _surface_bytes(surface: pg.Surface) -> int:
+    return surface.get_pitch() * surface.get_height()
+
+
+class AssetRegistry:
+    """Indice degli asset dichiarati in [paths.*], decodificati al primo uso.
+
+    Le superfici sono conservate già convertite nel formato del display; se la
+    memoria occupata supera il budget vengono scartate per prime le immagini
+    grandi usate meno di recente (le chiavi in `pinned` non vengono mai scartate).
+    """
+
+    def __init__(
+        self,
+        budget_bytes: int = int(_config.get("gui.assets.memory_budget_mb", 64) * 2**20),
+        evict_min_bytes: int = int(_config.get("gui.assets.evict_min_kb", 256) * 2**10),
+        pinned: Iterable[str] = _config.get("gui.assets.pinned", ()),
+        workers: int = _config.get("gui.assets.workers", 2),
+    ) -> None:
+        self._budget = budget_bytes
+        self._evict_min = evict_min_bytes
+        self._pinned = set(pinned)
+        self._index: dict[str, Path] = self._build_index()
+        self._cache: OrderedDict[str, pg.Surface] = OrderedDict()
+        self._used = 0
+        self._decoding: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="Assets")
+        _logger.debug(f"Asset registry: {len(self._index)} assets indexed")
+
+    def _build_index(self) -> dict[str, Path]:
+        index = {}
+        for path in _config.get("paths.folders"):
+            folder = _config.get("paths.folders." + path)
+            files = _config.get("paths." + path)
+            if not files:
+                continue
+            for key, file in files.items():
+                index[key] = Path(folder) / Path(file)
+        return index
+
+    def path(self, key: str) -> Path:
+        try:
+            return self._index[key]
+        except KeyError:
+            raise ConfigLookupError(f"Impossibile trovare {key}") from None
+
+    def _decode(self, key: str) -> Future:
+        # chiamata con il lock acquisito
+        future = self._decoding.get(key)
+        if future is None:
+            future = self._pool.submit(pg.image.load, self.path(key))
+            self._decoding[key] = future
+        return future
+
+    def prefetch(self, keys: Iterable[str] | None = None) -> list[Future]:
+        """Avvia in parallelo la decodifica degli asset non ancora in cache."""
+        keys = self._index.keys() if keys is None else keys
+        with self._lock:
+            return [self._decode(key) for key in keys if key not in self._cache]
+
+    def get(self, key: str) -> pg.Surface:
+        """Restituisce la superficie convertita; va chiamata dal thread del display."""
+        with self._lock:
+            surface = self._cache.get(key)
+            if surface is not None:
+                self._cache.move_to_end(key)
+                return surface
+            future = self._decode(key)
+        try:
+            surface = future.result()
+        finally:
+            # anche se la decodifica è fallita: la prossima richiesta riprova
+            with self._lock:
+                if self._decoding.get(key) is future:
+                    del self._decoding[key]
+        if surface.get_flags() & pg.SRCALPHA:
+            surface = surface.convert_alpha()
+        else:
+            surface = surface.convert()
+        with self._lock:
+            self._cache[key] = surface
+            self._used += _surface_bytes(surface)
+            self._evict()
+        return surface
+
+    def _evict(self) -> None:
+        # chiamata con il lock acquisito
+        for key in list(self._cache.keys()):
+            if self._used <= self._budget:
+                return
+            surface = self._cache[key]
+            size = _surface_bytes(surface)
+            if key in self._pinned or size < self._evict_min:
+                continue
+            del self._cache[key]
+            self._used -= size
+            _logger.debug(f"Asset {key} evicted ({size // 1024} KB)")
+
+    def clear(self) -> None:
+        """Scarta le superfici convertite, ad esempio dopo un cambio di display."""
+        with self._lock:
+            self._cache.clear()
+            self._used = 0
+
+    def stop(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
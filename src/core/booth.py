@@ -0,0 +1,328 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import time
+from typing import Callable
+
+from core.animation import AnimationEncoder
+from core.catalog import PhotoCatalog, SessionStatus
+from core.config import _config
+from core.exceptions import CameraError, SessionInterruptedError
+from core.face_crop import FaceCropper
+from core.filters import ColorGrader
+from core.frame_pool import Frame
+from core.idle import IdleManager
+from core.layout import LayoutRegistry
+from core.journal import JournaledSession, SessionJournal
+from core.image_utils import cm_to_px, pil_to_pygame
+from core.logger import _logger
+from core.manager.board_manager import BoardManager
+from core.manager.camera_manager import CameraManager
+from core.manager.gui_manager import GuiManager, pg
+from core.manager.printer_manager import PrinterJobStates, PrinterManager
+from core.print_queue import PrintQueue
+from core.retention import RetentionManager
+from core.startup import lazy_import
+from core.storage import STREAM_EXTENSION, PhotoStorage
+from core.thumbnails import ThumbnailCache
+
+PIL = lazy_import("PIL.Image")
+cv2 = lazy_import("cv2")
+
+
+class BoothServices:
+    """Risorse condivise da tutte le postazioni dello stesso processo."""
+
+    def __init__(
+        self,
+        catalog: PhotoCatalog,
+        storage: PhotoStorage,
+        printer: PrinterManager,
+        print_queue: PrintQueue,
+        compositor: ThreadPoolExecutor,
+        grader: ColorGrader,
+        thumbnails: ThumbnailCache | None,
+        animations: AnimationEncoder | None,
+        retention: RetentionManager,
+        journal: SessionJournal,
+        layouts: LayoutRegistry,
+    ) -> None:
+        self.catalog = catalog
+        self.storage = storage
+        self.printer = printer
+        self.print_queue = print_queue
+        self.compositor = compositor
+        self.grader = grader
+        self.thumbnails = thumbnails
+        self.animations = animations
+        self.retention = retention
+        self.journal = journal
+        self.layouts = layouts
+        self._booths: set[str] = set()
+        self._idle: set[str] = set()
+
+    def register(self, booth: str) -> None:
+        self._booths.add(booth)
+
+    def set_idle(self, booth: str, idle: bool) -> None:
+        """La pulizia dello spazio lavora solo quando tutte le postazioni sono inattive."""
+        if idle:
+            self._idle.add(booth)
+        else:
+            self._idle.discard(booth)
+        self.retention.set_idle(self._idle >= self._booths)
+
+
+class Booth:
+    """Una postazione: fotocamera, pin e area del display con il proprio ciclo di sessioni.
+
+    Le postazioni girano come task asyncio sul thread principale; scatto e
+    composizione vengono eseguiti su thread, così il conto alla rovescia di
+    una postazione non attende mai il lavoro di un'altra.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        gui: GuiManager,
+        camera: CameraManager,
+        board: BoardManager,
+        pins: str,
+        services: BoothServices,
+        debug: bool = False,
+        on_token_screen: Callable[[], None] | None = None,
+    ) -> None:
+        self.name = name
+        self._gui = gui
+        self._camera = camera
+        self._board = board
+        self._pins = pins
+        self._services = services
+        self._debug = debug
+        self._on_token_screen = on_token_screen
+        self._idle = IdleManager(camera)
+        self._cropper = FaceCropper()
+        self._button_pressed_at = time.perf_counter()
+        # sessioni interrotte senza foto complete: si riparte senza gettone
+        self._credits: list[str] = []
+        self._stream_pixels = _config.get("photo.stream.min_megapixels", 20) * 1_000_000
+        services.register(name)
+
+    @property
+    def camera(self) -> CameraManager:
+        return self._camera
+
+    def _pin(self, module: str) -> int:
+        return _config.get(f"{self._pins}.{module}.pin")
+
+    async def wait_module(self, pin: int, idle: bool = False) -> bool:
+        while True:
+            if idle:
+                self._idle.tick()
+            await asyncio.sleep(self._idle.poll_interval)
+            if self._debug:
+                if self._gui.is_pressed(pg.K_k):
+                    _logger.info(f"[{self.name}] Skip stage")
+                    return True
+            if self._board.get_pin_state(pin):
+                _logger.info(f"[{self.name}] A token has been registered")
+                return True
+            if self._gui.request_to_stop():
+                _logger.info("A request to stop has been registered")
+                return False
+
+    def prepare_final_pic(self) -> tuple[PIL.Image.Image, Path]:
+        """Composizione del foglio: eseguita nel pool condiviso dei compositori."""
+        frames = [self._camera.pop_pic() for _ in range(_config.get("photo.count"))]
+        return self._compose([frame for frame in frames if frame is not None])
+
+    def recompose(self, paths: list[Path]) -> tuple[PIL.Image.Image, Path]:
+        """Composizione del foglio dalle foto salvate nel giornale."""
+        frames = []
+        for path in paths:
+            image = cv2.imread(str(path))
+            if image is None:
+                raise OSError(f"Can't read journal frame {path}")
+            frame = Frame.wrap(image)
+            self._cropper.submit(frame)
+            frames.append(frame)
+        return self._compose(frames)
+
+    def _compose(self, frames: list[Frame]) -> tuple[PIL.Image.Image, Path]:
+        format_size = self._services.printer.get_sheet_format_size(
+            _config.get("usb.printer.sheet_format")
+        )
+        format_size = cm_to_px(format_size, _config.get("usb.printer.dpi"))[::-1]
+        layout = self._services.layouts.get(format_size)
+        try:
+            # ogni foto ritagliata con le proporzioni del suo slot
+            pics = [
+                self._cropper.crop(frame, slot.size)
+                for frame, slot in zip(frames, layout.slots)
+            ]
+            if layout.size[0] * layout.size[1] >= self._stream_pixels:
+                # fogli grandi: composti e codificati a strisce, in memoria resta un'anteprima
+                merged, path = self._services.storage.save_with(
+                    lambda file: layout.stream(pics, file, self._services.grader.apply),
+                    STREAM_EXTENSION,
+                )
+            else:
+                merged = layout.render(pics, self._services.grader.apply)
+                path = self._services.storage.save(merged)
+        finally:
+            for frame in frames:
+                frame.release()
+        _logger.debug(f"[{self.name}] Camera metrics: {self._camera.metrics()}")
+        _logger.debug(f"[{self.name}] Face crop stats: {self._cropper.stats()}")
+        return merged, path
+
+    async def run_session(self, session_id: str) -> None:
+        catalog, journal = self._services.catalog, self._services.journal
+        pics_count: int = _config.get("photo.count")
+        timings: dict[str, float] = {}
+        started = time.perf_counter()
+        self._camera.clear()
+        try:
+            # avvio sequenza foto
+            for i in range(1, pics_count + 1):
+                _logger.info(f"[{self.name}] Processing photo {i}/{pics_count}")
+                if i == 1:
+                    elapsed = (time.perf_counter() - self._button_pressed_at) * 1000
+                    _logger.info(f"[{self.name}] Button to first countdown: {elapsed:.0f} ms")
+                frame = await self._take_pic(i)
+                # le foto del giornale sono temporanee: nel catalogo resta solo l'istante
+                journal.save_frame(session_id, i, frame)
+                catalog.add_frame(session_id, i, time.time())
+            timings["capture"] = time.perf_counter() - started
+            # unisco le foto
+            loop = asyncio.get_running_loop()
+            pic, pic_path = await loop.run_in_executor(
+                self._services.compositor, self.prepare_final_pic
+            )
+            timings["compose"] = time.perf_counter() - started - timings["capture"]
+        except Exception as e:
+            catalog.finish_session(session_id, None, timings, SessionStatus.FAILED)
+            if not isinstance(e, SessionInterruptedError):
+                # se l'ha interrotta l'operatore resta aperta: il gettone verrà riaccreditato
+                journal.close(session_id)
+            raise
+        catalog.finish_session(session_id, pic_path, timings)
+        journal.sheet(session_id, pic_path)
+        if self._services.thumbnails:
+            # dall'immagine in memoria: il foglio salvato non viene riletto
+            self._services.thumbnails.schedule(pic_path, pic)
+        if self._services.animations:
+            self._services.animations.submit(self._camera.pop_clip(), pic_path)
+        # mostro schermata stampa in corso con riepilogo foto
+        await self._gui.show_print_preview(pil_to_pygame(pic))
+        # avvio stampa foto e attendo il termine
+        await self._services.print_queue.submit(session_id, pic_path)
+        journal.done(session_id)
+        # mostro schermata di saluti (fine)
+
+    async def _shoot(self, nth: int) -> Frame:
+        """Conto alla rovescia e scatto, entrambi legati alla scadenza dell'otturatore."""
+        shutter = self._camera.shutter
+        deadline = shutter.arm(self._gui.countdown_duration())
+        # il thread della fotocamera attende la scadenza da solo, senza passare dalla gui
+        shot = asyncio.ensure_future(asyncio.to_thread(self._camera.take_pic, deadline))
+        if not await self._gui.show_countdown_screen(nth, deadline):
+            shutter.cancel()
+            # l'eventuale foto resta in coda e viene scartata dalla prossima sessione
+            await asyncio.gather(shot, return_exceptions=True)
+            raise SessionInterruptedError(f"Stop requested during photo {nth}")
+        # la lettura può bloccare fino al timeout del watchdog
+        return await shot
+
+    async def _take_pic(self, nth: int) -> Frame:
+        retries: int = _config.get("usb.camera.max_retries", 2)
+        for attempt in range(retries + 1):
+            try:
+                frame = await self._shoot(nth)
+                self._cropper.submit(frame)
+                return frame
+            except CameraError as e:
+                if attempt == retries:
+                    raise
+                _logger.warning(f"[{self.name}] Photo {nth} failed ({e}), retrying")
+                self._gui.show_retry_screen()
+                await asyncio.to_thread(
+                    self._camera.wait_ready,
+                    _config.get("usb.camera.reconnect_wait_sec", 10),
+                )
+
+    def credit(self, session_id: str) -> None:
+        """La prossima sessione parte senza gettone, al posto di `session_id`."""
+        self._credits.append(session_id)
+
+    async def resume(self, session: JournaledSession) -> None:
+        """Completa una sessione interrotta: stampa il foglio, ricomponendolo se serve."""
+        services = self._services
+        sheet = session.sheet if session.sheet and session.sheet.is_file() else None
+        if sheet is None:
+            loop = asyncio.get_running_loop()
+            try:
+                _, sheet = await loop.run_in_executor(
+                    services.compositor,
+                    self.recompose,
+                    session.frame_paths(_config.get("photo.count")),
+                )
+            except Exception as e:
+                _logger.error(f"[{self.name}] Can't recompose session {session.id}: {e}")
+                self.credit(session.id)
+                return
+            services.catalog.finish_session(session.id, sheet, {})
+            services.journal.sheet(session.id, sheet)
+        if session.print_job:
+            # la stampa interrotta non è mai terminata: se ne accoda una nuova
+            services.catalog.update_print_job(session.print_job, PrinterJobStates.ABORTED.name)
+        _logger.info(f"[{self.name}] Printing recovered session {session.id}")
+        await services.print_queue.submit(session.id, sheet)
+        services.journal.done(session.id)
+
+    async def _wait_token(self) -> bool:
+        # mostro schermata attesa gettone
+        self._gui.show_token_screen()
+        if self._on_token_screen:
+            self._on_token_screen()
+        # aspetto inserimento gettone, intanto la pulizia dello spazio può lavorare
+        self._services.set_idle(self.name, True)
+        token = await self.wait_module(self._pin("microswitch"), True)
+        self._services.set_idle(self.name, False)
+        return token
+
+    async def run(self) -> None:
+        catalog, journal = self._services.catalog, self._services.journal
+        while True:
+            credit = self._credits.pop(0) if self._credits else None
+            if credit is None and not await self._wait_token():
+                break
+            self._idle.wake()
+            session_id = catalog.start_session()
+            journal.start(session_id, self.name)
+            if credit:
+                _logger.info(f"[{self.name}] Session {credit} was interrupted, token credited")
+                journal.close(credit, credited_to=session_id)
+                catalog.finish_session(credit, None, {}, SessionStatus.FAILED)
+            # mostro schermata attesa pressione pulsante
+            self._gui.show_button_screen()
+            # aspetto pressione pulsante
+            if not await self.wait_module(self._pin("button")):
+                break
+            self._button_pressed_at = time.perf_counter()
+            try:
+                await self.run_session(session_id)
+            except CameraError as e:
+                _logger.error(f"[{self.name}] Session aborted: {e}")
+            except SessionInterruptedError as e:
+                _logger.info(f"A request to stop has been registered: {e}")
+                break
+            self._idle.activity()
+
+    def stop(self) -> None:
+        self._board.stop()
+        self._cropper.stop()
+        self._camera.stop()
+        self._gui.stop()
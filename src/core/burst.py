@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import threading
+import time
+from typing import Any
+
+from core.config import _config
+from core.logger import _logger
+from core.startup import lazy_import
+
+cv2 = lazy_import("cv2")
+
+# penalità applicata ai fotogrammi con un volto ma senza occhi aperti rilevati
+_BLINK_PENALTY = 0.5
+
+
+class BurstScorer:
+    """Sceglie il fotogramma migliore di una raffica.
+
+    Il punteggio è la varianza del Laplaciano su una copia ridotta in scala di
+    grigi; facoltativamente penalizza i volti senza occhi rilevati (occhi chiusi).
+    I fotogrammi non valutati entro `budget_ms` vengono ignorati.
+    """
+
+    def __init__(
+        self,
+        budget_ms: float = _config.get("photo.burst.budget_ms", 100),
+        score_width: int = _config.get("photo.burst.score_width", 320),
+        eye_check: bool = _config.get("photo.burst.eye_check", False),
+        workers: int = _config.get("photo.burst.workers", 2),
+    ) -> None:
+        self._budget = budget_ms / 1000
+        self._width = score_width
+        self._eye_check = eye_check
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="BurstScorer")
+
+    def _cascades(self) -> tuple[Any, Any]:
+        # i classificatori non sono thread-safe: uno per worker
+        if not hasattr(self._local, "faces"):
+            self._local.faces = cv2.CascadeClassifier(
+                cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+            )
+            self._local.eyes = cv2.CascadeClassifier(
+                cv2.data.haarcascades + "haarcascade_eye_tree_eyeglasses.xml"
+            )
+        return self._local.faces, self._local.eyes
+
+    def _blink_factor(self, gray: Any) -> float:
+        faces_cascade, eyes_cascade = self._cascades()
+        faces = faces_cascade.detectMultiScale(gray, 1.2, 4, minSize=(24, 24))
+        for x, y, w, h in faces:
+            # gli occhi stanno nella metà superiore del volto
+            eyes = eyes_cascade.detectMultiScale(gray[y : y + h // 2, x : x + w], 1.1, 3)
+            if len(eyes) == 0:
+                return _BLINK_PENALTY
+        return 1
+
+    def score(self, frame: Any) -> float:
+        h, w = frame.shape[:2]
+        scale = min(1, self._width / w)
+        small = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+        if self._eye_check:
+            sharpness *= self._blink_factor(gray)
+        return sharpness
+
+    def submit(self, frame: Any) -> Future:
+        return self._pool.submit(self.score, frame)
+
+    def best(self, scores: list[Future]) -> int:
+        """Indice del fotogramma migliore tra quelli valutati entro il budget."""
+        started = time.perf_counter()
+        done, pending = wait(scores, timeout=self._budget)
+        for future in pending:
+            future.cancel()
+        results = {
+            i: future.result()
+            for i, future in enumerate(scores)
+            if future in done and not future.exception()
+        }
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if not results:
+            _logger.warning(f"Burst scoring over budget ({elapsed_ms:.0f} ms), keeping first frame")
+            return 0
+        best = max(results, key=results.get)
+        _logger.debug(
+            f"Burst frame {best + 1}/{len(scores)} selected ({len(results)} scored, waited {elapsed_ms:.1f} ms)"
+        )
+        return best
+
+    def stop(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
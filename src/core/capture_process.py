@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import multiprocessing
+from multiprocessing import shared_memory
+import time
+from typing import Any
+
+from core.config import _config
+from core.logger import _logger
+from core.startup import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+# intestazione: [fotogrammi scritti, processo attivo] + una sequenza per slot
+_COUNT, _ALIVE, _SEQ = 0, 1, 2
+_POLL_SEC = 0.001
+
+
+class _Ring:
+    """Viste ndarray sul blocco di memoria condivisa.
+
+    Ogni slot ha un numero di sequenza (seqlock): dispari mentre il processo di
+    acquisizione scrive, pari quando il fotogramma è completo. Il lettore
+    scarta le letture durante le quali la sequenza è cambiata.
+    """
+
+    def __init__(self, buffer: Any, slots: int, shape: tuple[int, int, int]) -> None:
+        self.header = np.ndarray((_SEQ + slots,), np.int64, buffer=buffer)
+        self.stamps = np.ndarray(
+            (slots,), np.float64, buffer=buffer, offset=self.header.nbytes
+        )
+        self.frames = np.ndarray(
+            (slots, *shape),
+            np.uint8,
+            buffer=buffer,
+            offset=self.header.nbytes + self.stamps.nbytes,
+        )
+
+    @staticmethod
+    def size(slots: int, shape: tuple[int, int, int]) -> int:
+        return (_SEQ + slots) * 8 + slots * 8 + slots * int(np.prod(shape))
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # il blocco appartiene al processo principale, che lo rimuove in `release()`
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: con "spawn" il figlio condivide il resource_tracker del
+        # padre, dove il nome è già registrato
+        return shared_memory.SharedMemory(name=name)
+
+
+def _capture_main(camera_id: int, slots: int, conn: Any, stop: Any) -> None:
+    # eseguita nel processo di acquisizione
+    cv2.setLogLevel(0)
+    camera = cv2.VideoCapture(camera_id)
+    if not camera.isOpened():
+        conn.send(None)
+        return
+    shape = (
+        int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        int(camera.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        3,
+    )
+    conn.send(shape)
+    name = conn.recv()
+    if name is None:
+        camera.release()
+        return
+    shm = _attach(name)
+    ring = _Ring(shm.buf, slots, shape)
+    ring.header[_ALIVE] = 1
+    target = image = None
+    try:
+        while not stop.is_set():
+            slot = ring.header[_COUNT] % slots
+            target = ring.frames[slot]
+            ring.header[_SEQ + slot] += 1
+            result, image = camera.read(target)
+            if result and image is not target:
+                if image.shape != target.shape:
+                    result = False
+                else:
+                    np.copyto(target, image)
+            ring.stamps[slot] = time.monotonic()
+            ring.header[_SEQ + slot] += 1
+            if not result:
+                break
+            ring.header[_COUNT] += 1
+    finally:
+        ring.header[_ALIVE] = 0
+        camera.release()
+        # le viste devono sparire prima di chiudere la mappatura
+        ring = target = image = None
+        shm.close()
+
+
+class SharedMemoryCapture:
+    """Sostituto di `cv2.VideoCapture` che acquisisce in un processo separato.
+
+    Il processo figlio legge dalla fotocamera direttamente negli slot di un
+    ring buffer in memoria condivisa, senza contendere il GIL al rendering;
+    `read()` copia l'ultimo fotogramma completo nel buffer del chiamante.
+    """
+
+    def __init__(
+        self,
+        camera_id: int,
+        slots: int = _config.get("usb.camera.process.slots", 4),
+        open_timeout: float = _config.get("usb.camera.process.open_timeout_sec", 10),
+        read_timeout: float = _config.get("usb.camera.read_timeout_ms", 2000) / 1000,
+    ) -> None:
+        self._slots = max(2, slots)
+        self._read_timeout = read_timeout
+        self._shm: shared_memory.SharedMemory | None = None
+        self._ring: _Ring | None = None
+        self._shape = (0, 0, 3)
+        self._last_count = 0
+        self.last_timestamp: float = 0
+        context = multiprocessing.get_context("spawn")
+        self._stop = context.Event()
+        conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_capture_main,
+            args=(camera_id, self._slots, child_conn, self._stop),
+            name=f"CameraCapture{camera_id}",
+            daemon=True,
+        )
+        self._process.start()
+        try:
+            shape = conn.recv() if conn.poll(open_timeout) else None
+            if shape is None or 0 in shape:
+                conn.send(None)
+                return
+            self._shape = tuple(shape)
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=_Ring.size(self._slots, self._shape)
+            )
+            self._ring = _Ring(self._shm.buf, self._slots, self._shape)
+            self._ring.header[:] = 0
+            conn.send(self._shm.name)
+        except (EOFError, OSError) as e:
+            _logger.warning(f"Camera capture process {camera_id} failed to start: {e}")
+        finally:
+            conn.close()
+        _logger.debug(
+            f"Camera capture process {self._process.pid} started ({self._shape}, {self._slots} slots)"
+        )
+
+    def isOpened(self) -> bool:
+        return self._ring is not None and self._process.is_alive()
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self._shape[1]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self._shape[0]
+        return 0
+
+    def _wait_frame(self, ring: _Ring) -> int | None:
+        deadline = time.monotonic() + self._read_timeout
+        while self._ring is ring:
+            count = int(ring.header[_COUNT])
+            if count > self._last_count:
+                return count
+            if not self._process.is_alive() or time.monotonic() > deadline:
+                return None
+            time.sleep(_POLL_SEC)
+        return None
+
+    def read(self, image: Any = None) -> tuple[bool, Any]:
+        """Ultimo fotogramma completo non ancora letto, come `VideoCapture.read`."""
+        ring = self._ring
+        if ring is None:
+            return False, None
+        if image is None or image.shape != self._shape:
+            image = np.empty(self._shape, np.uint8)
+        while (count := self._wait_frame(ring)) is not None:
+            slot = (count - 1) % self._slots
+            seq = int(ring.header[_SEQ + slot])
+            if seq % 2:
+                continue
+            np.copyto(image, ring.frames[slot])
+            stamp = float(ring.stamps[slot])
+            if ring.header[_SEQ + slot] != seq:
+                # slot riscritto durante la copia
+                continue
+            self._last_count = count
+            self.last_timestamp = stamp
+            return True, image
+        return False, None
+
+    def release(self) -> None:
+        self._stop.set()
+        self._process.join(timeout=2)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        if self._shm is not None:
+            self._ring = None
+            try:
+                self._shm.close()
+            except BufferError:
+                # una lettura abbandonata dal watchdog usa ancora la mappatura
+                _logger.warning("Camera shared memory still in use, leaving it to the GC")
+            self._shm.unlink()
+            self._shm = None
@@ -0,0 +1,251 @@
+from enum import StrEnum
+import json
+import os
+from pathlib import Path
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any
+import uuid
+
+from core.config import _config
+from core.logger import _logger
+
+
+class SessionStatus(StrEnum):
+    STARTED = "started"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    ARCHIVED = "archived"
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    status TEXT NOT NULL,
+    sheet_path TEXT,
+    timings TEXT
+);
+CREATE TABLE IF NOT EXISTS frames (
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    idx INTEGER NOT NULL,
+    captured_at REAL NOT NULL,
+    path TEXT,
+    PRIMARY KEY (session_id, idx)
+);
+CREATE TABLE IF NOT EXISTS print_jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    job_id TEXT,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_started_at ON sessions(started_at);
+CREATE INDEX IF NOT EXISTS sessions_status ON sessions(status, started_at);
+CREATE INDEX IF NOT EXISTS print_jobs_status ON print_jobs(status, updated_at);
+CREATE INDEX IF NOT EXISTS print_jobs_session ON print_jobs(session_id);
+"""
+
+_Statement = tuple[str, tuple[Any, ...]]
+
+
+class PhotoCatalog:
+    """Catalogo SQLite di sessioni, foto sorgente, fogli e stampe.
+
+    Le scritture vengono accodate e salvate a blocchi da un thread dedicato,
+    quindi non bloccano mai il ciclo della sessione; le letture usano una
+    connessione per thread (il database è in modalità WAL).
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        batch_size: int = _config.get("catalog.batch_size", 64),
+        flush_interval: float = _config.get("catalog.flush_interval_sec", 1.0),
+    ) -> None:
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue: queue.Queue[_Statement | threading.Event | None] = queue.Queue()
+        self._local = threading.local()
+        with sqlite3.connect(self._path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        conn.close()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="CatalogWriter", daemon=True
+        )
+        self._writer.start()
+
+    # scrittura
+
+    def _write_loop(self) -> None:
+        conn = sqlite3.connect(self._path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        running = True
+        while running:
+            batch: list[_Statement] = []
+            waiters: list[threading.Event] = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self._flush_interval
+            while item is not None:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self._batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            running = item is not None
+            try:
+                with conn:
+                    for sql, params in batch:
+                        conn.execute(sql, params)
+            except sqlite3.Error as e:
+                _logger.error(f"Catalog write failed ({len(batch)} statements): {e}")
+            for waiter in waiters:
+                waiter.set()
+        conn.close()
+
+    def _enqueue(self, sql: str, *params: Any) -> None:
+        self._queue.put_nowait((sql, params))
+
+    def start_session(self) -> str:
+        session_id = uuid.uuid4().hex
+        self._enqueue(
+            "INSERT INTO sessions (id, started_at, status) VALUES (?, ?, ?)",
+            session_id,
+            time.time(),
+            SessionStatus.STARTED,
+        )
+        return session_id
+
+    def add_frame(
+        self, session_id: str, idx: int, captured_at: float, path: Path | None = None
+    ) -> None:
+        self._enqueue(
+            "INSERT OR REPLACE INTO frames (session_id, idx, captured_at, path) VALUES (?, ?, ?, ?)",
+            session_id,
+            idx,
+            captured_at,
+            str(path) if path else None,
+        )
+
+    def finish_session(
+        self,
+        session_id: str,
+        sheet_path: Path | None,
+        timings: dict[str, float],
+        status: SessionStatus = SessionStatus.COMPLETED,
+    ) -> None:
+        self._enqueue(
+            "UPDATE sessions SET ended_at = ?, status = ?, sheet_path = ?, timings = ? WHERE id = ?",
+            time.time(),
+            status,
+            str(sheet_path) if sheet_path else None,
+            json.dumps(timings),
+            session_id,
+        )
+
+    def add_print_job(self, session_id: str, status: str) -> str:
+        print_id = uuid.uuid4().hex
+        now = time.time()
+        self._enqueue(
+            "INSERT INTO print_jobs (id, session_id, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            print_id,
+            session_id,
+            status,
+            now,
+            now,
+        )
+        return print_id
+
+    def update_print_job(
+        self, print_id: str, status: str, job_id: str | None = None
+    ) -> None:
+        self._enqueue(
+            "UPDATE print_jobs SET status = ?, job_id = COALESCE(?, job_id), updated_at = ? WHERE id = ?",
+            status,
+            job_id,
+            time.time(),
+            print_id,
+        )
+
+    def mark_archived(self, folder: Path) -> None:
+        """Segna come archiviate le sessioni con il foglio nella cartella indicata."""
+        prefix = f"{Path(folder)}{os.sep}"
+        self._enqueue(
+            "UPDATE sessions SET status = ? WHERE substr(sheet_path, 1, ?) = ?",
+            SessionStatus.ARCHIVED,
+            len(prefix),
+            prefix,
+        )
+
+    # lettura
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"{self._path.resolve().as_uri()}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql: str, *params: Any) -> list[dict[str, Any]]:
+        return [dict(row) for row in self._reader().execute(sql, params)]
+
+    def session(self, session_id: str) -> dict[str, Any] | None:
+        rows = self._query("SELECT * FROM sessions WHERE id = ?", session_id)
+        return rows[0] if rows else None
+
+    def frames(self, session_id: str) -> list[dict[str, Any]]:
+        return self._query(
+            "SELECT * FROM frames WHERE session_id = ? ORDER BY idx", session_id
+        )
+
+    def sheets(self, limit: int = 50, offset: int = 0) -> list[dict[str, Any]]:
+        """Fogli completati, dal più recente."""
+        return self._query(
+            "SELECT * FROM sessions WHERE status = ? AND sheet_path IS NOT NULL "
+            "ORDER BY started_at DESC LIMIT ? OFFSET ?",
+            SessionStatus.COMPLETED,
+            limit,
+            offset,
+        )
+
+    def count_sheets(self) -> int:
+        rows = self._query(
+            "SELECT COUNT(*) AS n FROM sessions WHERE status = ? AND sheet_path IS NOT NULL",
+            SessionStatus.COMPLETED,
+        )
+        return rows[0]["n"]
+
+    def sessions_between(self, start: float, end: float) -> list[dict[str, Any]]:
+        return self._query(
+            "SELECT * FROM sessions WHERE started_at >= ? AND started_at < ? ORDER BY started_at",
+            start,
+            end,
+        )
+
+    def print_jobs(self, status: str) -> list[dict[str, Any]]:
+        return self._query(
+            "SELECT * FROM print_jobs WHERE status = ? ORDER BY updated_at", status
+        )
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Attende che le scritture accodate finora siano state salvate."""
+        done = threading.Event()
+        self._queue.put_nowait(done)
+        return done.wait(timeout)
+
+    def stop(self) -> None:
+        self._queue.put_nowait(None)
+        self._writer.join()
@@ -9,6 +9,8 @@ class Config:
     def __init__(self, config_path: str = "config.toml") -> None:
         self.config_path = Path(config_path)
         self.config: dict[str, Any] = self.load_config()
+        # incrementata a ogni `reload()`, per invalidare ciò che dipende dalla configurazione
+        self.version: int = 0
 
     def load_config(self) -> None:
         if self.config_path.exists():
@@ -19,6 +21,11 @@ class Config:
                 f"Configurazione '{self.config_path}' non trovata."
             )
 
+    def reload(self) -> None:
+        """Rilegge il file; se non è valido la configurazione attuale resta in uso."""
+        self.config = self.load_config()
+        self.version += 1
+
     def get(self, key: str, default: Any = None) -> Any:
         """Accesso con dot notation: config.get('app.name')"""
         keys = key.split(".")
@@ -57,6 +57,13 @@ class CannotTakePictureError(CameraError):
         super().__init__(*args)
 
 
+class CaptureCancelledError(CameraError):
+    """Scheduled capture cancelled before the shutter deadline."""
+
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+
+
 # Printer errors
 
 
@@ -69,3 +76,30 @@ class PrinterInvalidSheetFormatError(PrinterError):
 
     def __init__(self, *args):
         super().__init__(*args)
+
+
+# Gui errors
+
+
+class SessionInterruptedError(Exception):
+    """Stop requested by the user during a photo session."""
+
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+
+
+# Photo errors
+
+
+class InvalidLookError(ConfigurationError):
+    """Photo look not found or LUT file not valid."""
+
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+
+
+class InvalidLayoutError(ConfigurationError):
+    """Sheet layout template not found or not valid."""
+
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import threading
+import time
+from typing import Any
+
+from core.config import _config
+from core.frame_pool import Frame
+from core.logger import _logger
+from core.startup import lazy_import
+
+cv2 = lazy_import("cv2")
+
+_Box = tuple[int, int, int, int]
+
+
+class FaceCropper:
+    """Ritaglia i fotogrammi con le proporzioni della cella, centrando i volti.
+
+    Il rilevamento gira su un worker, su una copia ridotta, mentre prosegue il
+    conto alla rovescia successivo; i volti trovati restano associati al
+    fotogramma. Se il rilevamento non termina entro `budget_ms` dall'avvio
+    si usa un ritaglio centrato.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = _config.get("photo.crop.face_aware", True),
+        budget_ms: float = _config.get("photo.crop.budget_ms", 300),
+        detect_width: int = _config.get("photo.crop.detect_width", 480),
+        margin: float = _config.get("photo.crop.margin", 0.3),
+    ) -> None:
+        self._enabled = enabled
+        self._budget = budget_ms / 1000
+        self._width = detect_width
+        self._margin = margin
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(1, thread_name_prefix="FaceCropper")
+        self._stats = {"detected": 0, "center_fallbacks": 0}
+
+    def _cascade(self) -> Any:
+        if not hasattr(self._local, "cascade"):
+            self._local.cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+            )
+        return self._local.cascade
+
+    def _detect(self, frame: Frame, submitted_at: float) -> list[_Box] | None:
+        try:
+            h, w = frame.data.shape[:2]
+            scale = min(1, self._width / w)
+            small = cv2.resize(
+                frame.data, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA
+            )
+            gray = cv2.equalizeHist(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY))
+            faces = self._cascade().detectMultiScale(gray, 1.15, 5, minSize=(24, 24))
+            elapsed = time.monotonic() - submitted_at
+            if elapsed > self._budget:
+                _logger.warning(
+                    f"Face detection over budget ({elapsed * 1000:.0f}/{self._budget * 1000:.0f} ms)"
+                )
+                return None
+            return [
+                tuple(int(v / scale) for v in (x, y, x + fw, y + fh))
+                for x, y, fw, fh in faces
+            ]
+        finally:
+            frame.release()
+
+    def submit(self, frame: Frame) -> None:
+        """Avvia il rilevamento; il fotogramma resta trattenuto fino alla fine.
+
+        Il budget parte da qui e non dallo scatto: attesa della scadenza, raffica
+        e fotogrammi di riserva lo consumerebbero prima ancora di iniziare.
+        """
+        if self._enabled and frame.faces is None:
+            # lo stesso fotogramma di riserva può arrivare più volte: un solo rilevamento
+            submitted_at = time.monotonic()
+            frame.faces = self._pool.submit(self._detect, frame.retain(), submitted_at)
+            frame.faces.submitted_at = submitted_at
+
+    def faces(self, frame: Frame) -> list[_Box] | None:
+        """Volti del fotogramma, o `None` se il rilevamento è fuori budget."""
+        if frame.faces is None:
+            return None
+        remaining = frame.faces.submitted_at + self._budget - time.monotonic()
+        try:
+            return frame.faces.result(timeout=max(0, remaining))
+        except TimeoutError:
+            if frame.faces.cancel():
+                # il lavoro non è mai partito: il riferimento va rilasciato qui
+                frame.release()
+            _logger.warning(f"Face detection not finished within {self._budget * 1000:.0f} ms")
+        except Exception as e:
+            _logger.warning(f"Face detection failed: {e}")
+        return None
+
+    def _window(self, shape: tuple[int, ...], cell: tuple[int, int], faces: list[_Box]) -> _Box:
+        h, w = shape[:2]
+        aspect = cell[0] / cell[1]
+        crop_w, crop_h = min(w, int(h * aspect)), min(h, int(w / aspect))
+        cx, cy = w / 2, h / 2
+        if faces:
+            x0 = min(f[0] for f in faces)
+            y0 = min(f[1] for f in faces)
+            x1 = max(f[2] for f in faces)
+            y1 = max(f[3] for f in faces)
+            # un po' di spazio sopra le teste: il centro sale di `margin` volti
+            face_h = max(f[3] - f[1] for f in faces)
+            cx, cy = (x0 + x1) / 2, (y0 + y1) / 2 - face_h * self._margin
+        left = int(min(max(cx - crop_w / 2, 0), w - crop_w))
+        top = int(min(max(cy - crop_h / 2, 0), h - crop_h))
+        return left, top, left + crop_w, top + crop_h
+
+    def crop(self, frame: Frame, cell: tuple[int, int]) -> Any:
+        """Vista del fotogramma con le proporzioni di `cell` (larghezza, altezza)."""
+        faces = self.faces(frame) if self._enabled else None
+        if faces is None and self._enabled:
+            self._stats["center_fallbacks"] += 1
+        elif faces:
+            self._stats["detected"] += 1
+        x0, y0, x1, y1 = self._window(frame.data.shape, cell, faces or [])
+        return frame.data[y0:y1, x0:x1]
+
+    def stats(self) -> dict[str, int]:
+        return dict(self._stats)
+
+    def stop(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import functools
+from pathlib import Path
+import time
+from typing import Any, Callable
+
+from core.config import _config
+from core.exceptions import InvalidLookError
+from core.logger import _logger
+from core.startup import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+
+class Look:
+    """Trasformazione colore applicata in place a un fotogramma BGR.
+
+    Ogni passo è facoltativo: miscelazione dei canali (matrice 3x3), LUT 1D a
+    256 valori per canale e LUT 3D con interpolazione trilineare.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        matrix: Any = None,
+        lut: Any = None,
+        lut3d: Any = None,
+    ) -> None:
+        self.name = name
+        self._matrix = matrix
+        if lut is not None and (lut == lut[..., :1]).all():
+            # stessa curva su tutti i canali: la LUT a un canale è molto più veloce
+            lut = lut[..., 0]
+        self._lut = lut
+        self._table = None
+        if lut3d is not None:
+            size = round(len(lut3d) ** (1 / 3))
+            # la tabella .cube varia prima su R, poi su G, infine su B. R e G
+            # vengono interpolati subito su tutti i 256 valori: vista come
+            # immagine (B*256 + G, R) resta da interpolare solo B, fondendo le
+            # letture esatte di due piani con `cv2.remap`
+            table = _expand(_expand(lut3d.reshape(size, size, size, 3), 2), 1)
+            self._table = table.reshape(size * 256, 256, 3)
+            lower, weight = _lattice(size)
+            self._x_index = np.arange(256, dtype=np.float32)
+            self._y_index = (lower * 256).astype(np.float32)
+            self._b_weight = weight.astype(np.float32)
+
+    def apply(self, image: Any) -> Any:
+        if self._matrix is not None:
+            cv2.transform(image, self._matrix, dst=image)
+        if self._lut is not None:
+            cv2.LUT(image, self._lut, dst=image)
+        if self._table is not None:
+            b, g, r = cv2.split(image)
+            x = cv2.LUT(r, self._x_index)
+            y = cv2.add(cv2.LUT(b, self._y_index), cv2.LUT(g, self._x_index))
+            # coordinate intere: le letture sono esatte, l'interpolazione su B è qui
+            below = cv2.remap(self._table, x, y, cv2.INTER_NEAREST)
+            above = cv2.remap(self._table, x, cv2.add(y, 256.0), cv2.INTER_NEAREST)
+            above -= below
+            above *= cv2.LUT(b, self._b_weight)[..., None]
+            above += below
+            np.copyto(image, np.rint(above), casting="unsafe")
+        return image
+
+
+def _lattice(size: int) -> tuple[Any, Any]:
+    """Per ogni valore 0-255: nodo inferiore della griglia e peso del successivo."""
+    position = np.arange(256) * (size - 1) / 255
+    lower = np.minimum(np.floor(position), size - 2).astype(np.intp)
+    return lower, position - lower
+
+
+def _expand(table: Any, axis: int) -> Any:
+    """Interpola linearmente l'asse `axis` della griglia su tutti i 256 valori."""
+    lower, weight = _lattice(table.shape[axis])
+    shape = [1] * table.ndim
+    shape[axis] = 256
+    weight = weight.reshape(shape)
+    below = np.take(table, lower, axis)
+    above = np.take(table, lower + 1, axis)
+    return (below + (above - below) * weight).astype(np.float32)
+
+
+def _curve(points: list[tuple[int, int]]) -> Any:
+    x, y = zip(*points)
+    return np.clip(np.interp(np.arange(256), x, y), 0, 255).astype(np.uint8)
+
+
+def _channel_lut(b: Any, g: Any, r: Any) -> Any:
+    return np.dstack((b, g, r)).astype(np.uint8)
+
+
+def _black_and_white() -> Look:
+    luma = [0.114, 0.587, 0.299]
+    curve = _curve([(0, 0), (64, 54), (192, 202), (255, 255)])
+    return Look("bw", np.array([luma] * 3, np.float32), _channel_lut(curve, curve, curve))
+
+
+def _sepia() -> Look:
+    # coefficienti sepia classici, righe e colonne in ordine BGR
+    matrix = np.array(
+        [
+            [0.131, 0.534, 0.272],
+            [0.168, 0.686, 0.349],
+            [0.189, 0.769, 0.393],
+        ],
+        np.float32,
+    )
+    return Look("sepia", matrix)
+
+
+def _warm() -> Look:
+    return Look(
+        "warm",
+        lut=_channel_lut(
+            _curve([(0, 0), (128, 112), (255, 235)]),
+            _curve([(0, 0), (128, 132), (255, 255)]),
+            _curve([(0, 8), (128, 146), (255, 255)]),
+        ),
+    )
+
+
+def _high_contrast() -> Look:
+    curve = _curve([(0, 0), (48, 24), (128, 128), (208, 232), (255, 255)])
+    return Look("high_contrast", lut=_channel_lut(curve, curve, curve))
+
+
+_BUILTIN_LOOKS: dict[str, Callable[[], Look]] = {
+    "bw": _black_and_white,
+    "sepia": _sepia,
+    "warm": _warm,
+    "high_contrast": _high_contrast,
+}
+
+
+def _parse_cube(path: Path) -> Any:
+    size = 0
+    domain_min, domain_max = [0.0] * 3, [1.0] * 3
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if not parts or parts[0].startswith("#") or parts[0] == "TITLE":
+                continue
+            keyword = parts[0].upper()
+            if keyword == "LUT_3D_SIZE":
+                size = int(parts[1])
+            elif keyword == "LUT_1D_SIZE":
+                raise InvalidLookError(f"{path}: 1D .cube files are not supported")
+            elif keyword == "DOMAIN_MIN":
+                domain_min = [float(v) for v in parts[1:4]]
+            elif keyword == "DOMAIN_MAX":
+                domain_max = [float(v) for v in parts[1:4]]
+            elif keyword[0].isalpha():
+                continue
+            else:
+                rows.append([float(v) for v in parts[:3]])
+    if size < 2 or len(rows) != size**3:
+        raise InvalidLookError(f"{path}: expected {size}^3 entries, found {len(rows)}")
+    table = (np.array(rows) - domain_min) / np.subtract(domain_max, domain_min)
+    # RGB -> BGR come i fotogrammi della fotocamera, in virgola mobile fino all'interpolazione
+    return np.clip(table[:, ::-1] * 255, 0, 255)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_cube(path: Path, mtime: float) -> Look:
+    started = time.perf_counter()
+    look = Look(path.stem, lut3d=_parse_cube(path))
+    _logger.debug(f"LUT {path} parsed in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return look
+
+
+def get_look(name: str) -> Look | None:
+    """Look predefinito per nome o LUT 3D da un file `.cube`; `None` se disattivato."""
+    if not name or name == "none":
+        return None
+    if name.lower().endswith(".cube"):
+        path = Path(name).resolve()
+        try:
+            return _load_cube(path, path.stat().st_mtime)
+        except (OSError, ValueError) as e:
+            raise InvalidLookError(f"Can't load LUT {path}: {e}") from e
+    try:
+        return _BUILTIN_LOOKS[name]()
+    except KeyError:
+        raise InvalidLookError(
+            f"Unknown look '{name}', expected one of {list(_BUILTIN_LOOKS)} or a .cube file"
+        ) from None
+
+
+class ColorGrader:
+    """Applica il look scelto per l'evento ai fotogrammi prima della composizione."""
+
+    def __init__(self, look: str = _config.get("photo.filter.look", "none")) -> None:
+        self._look = get_look(look)
+        if self._look:
+            _logger.info(f"Photo look: {self._look.name}")
+
+    def apply(self, image: Any) -> Any:
+        if self._look is None:
+            return image
+        started = time.perf_counter()
+        self._look.apply(image)
+        _logger.debug(
+            f"Look {self._look.name} applied in {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+        return image
+
+
+def benchmark(shape: tuple[int, int, int], repeat: int = 10) -> dict[str, float]:
+    """Tempo medio in ms di ogni look predefinito su un fotogramma di `shape`."""
+    rng = np.random.default_rng(0)
+    source = rng.integers(0, 256, shape, np.uint8)
+    image = np.empty_like(source)
+    looks = [build() for build in _BUILTIN_LOOKS.values()]
+    if (configured := get_look(_config.get("photo.filter.look", "none"))) is not None:
+        looks.append(configured)
+    results = {}
+    for look in looks:
+        elapsed = 0.0
+        for _ in range(repeat):
+            np.copyto(image, source)
+            started = time.perf_counter()
+            look.apply(image)
+            elapsed += time.perf_counter() - started
+        results[look.name] = round(elapsed / repeat * 1000, 2)
+    return results
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from collections import deque
+import threading
+import time
+from typing import Any
+
+from core.logger import _logger
+from core.startup import lazy_import
+
+np = lazy_import("numpy")
+
+_Shape = tuple[int, int, int]
+
+
+class Frame:
+    """Buffer BGR preso in prestito da un `FramePool`.
+
+    Il fotogramma passa per riferimento tra acquisizione, code e composizione:
+    chi lo conserva chiama `retain()`, chi ha finito chiama `release()`; quando
+    non ha più proprietari il buffer torna nel pool. Senza pool (foto lette da
+    disco) il buffer viene semplicemente lasciato al GC.
+    """
+
+    __slots__ = ("data", "captured_at", "faces", "_pool", "_lock", "_refs")
+
+    def __init__(self, pool: FramePool | None, data: Any) -> None:
+        self.data = data
+        self.captured_at: float = 0
+        # risultato del rilevamento volti (Future), se avviato
+        self.faces: Any = None
+        self._pool = pool
+        self._lock = pool._lock if pool is not None else threading.Lock()
+        self._refs = 1
+
+    @classmethod
+    def wrap(cls, data: Any) -> Frame:
+        """Fotogramma fuori da ogni pool, per un ndarray già esistente."""
+        frame = cls(None, data)
+        frame.captured_at = time.monotonic()
+        return frame
+
+    def retain(self) -> Frame:
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def release(self) -> None:
+        with self._lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            if self._refs < 0:
+                raise RuntimeError("Frame released more times than acquired")
+        if self._pool is not None:
+            self._pool._give_back(self.data)
+
+
+class FramePool:
+    """Buffer preallocati e riutilizzabili per i fotogrammi della fotocamera.
+
+    Quando i buffer liberi finiscono ne viene allocato uno nuovo (contato in
+    `overflow_allocations`); al rilascio vengono conservati al massimo
+    `capacity` buffer.
+    """
+
+    def __init__(self, shape: _Shape, capacity: int) -> None:
+        self._lock = threading.Lock()
+        self._shape = shape
+        self._capacity = capacity
+        self._free: deque[Any] = deque()
+        self._stats = {
+            "allocations": 0,
+            "overflow_allocations": 0,
+            "in_use": 0,
+            "peak_in_use": 0,
+        }
+        self._fill()
+
+    @property
+    def shape(self) -> _Shape:
+        return self._shape
+
+    def _allocate(self) -> Any:
+        # chiamata con il lock acquisito
+        self._stats["allocations"] += 1
+        return np.empty(self._shape, dtype=np.uint8)
+
+    def _fill(self) -> None:
+        with self._lock:
+            while len(self._free) < self._capacity:
+                self._free.append(self._allocate())
+
+    def resize(self, shape: _Shape) -> None:
+        """Adegua i buffer alla risoluzione negoziata con la fotocamera."""
+        if shape == self._shape:
+            return
+        _logger.info(f"Frame pool resized from {self._shape} to {shape}")
+        with self._lock:
+            self._shape = shape
+            self._free.clear()
+        self._fill()
+
+    def acquire(self) -> Frame:
+        with self._lock:
+            if self._free:
+                data = self._free.pop()
+            else:
+                data = self._allocate()
+                self._stats["overflow_allocations"] += 1
+            self._stats["in_use"] += 1
+            self._stats["peak_in_use"] = max(
+                self._stats["peak_in_use"], self._stats["in_use"]
+            )
+        frame = Frame(self, data)
+        frame.captured_at = time.monotonic()
+        return frame
+
+    def _give_back(self, data: Any) -> None:
+        with self._lock:
+            self._stats["in_use"] -= 1
+            # i buffer scartati o di una risoluzione precedente vengono lasciati al GC
+            if (
+                data is not None
+                and data.shape == self._shape
+                and len(self._free) < self._capacity
+            ):
+                self._free.append(data)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**self._stats, "free": len(self._free), "capacity": self._capacity}
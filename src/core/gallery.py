@@ -0,0 +1,298 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import html
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import math
+import mimetypes
+from pathlib import Path
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from core.catalog import PhotoCatalog
+from core.config import _config
+from core.logger import _logger
+from core.reprint import Reprinter
+from core.thumbnails import ThumbnailCache
+from core.utils import lower_thread_priority
+
+_CHUNK_SIZE = 64 * 1024
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class _BoundedHTTPServer(HTTPServer):
+    """HTTPServer che gestisce le richieste su un pool limitato di thread a bassa priorità."""
+
+    def __init__(self, address, handler, workers: int, niceness: int) -> None:
+        super().__init__(address, handler)
+        self._pool = ThreadPoolExecutor(
+            workers,
+            thread_name_prefix="Gallery",
+            initializer=partial(lower_thread_priority, niceness),
+        )
+        # oltre questo numero di richieste in coda le nuove connessioni vengono chiuse
+        self._slots = threading.BoundedSemaphore(workers * 4)
+
+    def process_request(self, request, client_address) -> None:
+        if not self._slots.acquire(blocking=False):
+            self.shutdown_request(request)
+            return
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _GalleryHandler(BaseHTTPRequestHandler):
+    server_version = "ScoutmatonGallery/1.0"
+
+    catalog: PhotoCatalog
+    thumbnails: ThumbnailCache
+    reprinter: Reprinter | None
+    admin_hosts: list[str]
+    per_page: int
+
+    def log_message(self, format: str, *args) -> None:
+        _logger.debug(f"Gallery {self.address_string()} - {format % args}")
+
+    def do_HEAD(self) -> None:
+        self._dispatch(send_body=False)
+
+    def do_GET(self) -> None:
+        self._dispatch(send_body=True)
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+        # le azioni dell'operatore solo dalla macchina locale, non dai telefoni
+        if self.client_address[0] not in self.admin_hosts:
+            self.send_error(HTTPStatus.FORBIDDEN)
+            return
+        match parts:
+            case ["admin", "reprint", session_id]:
+                self._reprint(self.reprinter.sessions([session_id]) if self.reprinter else [])
+            case ["admin", "reprint"] if "from" in query and "to" in query:
+                self._reprint(
+                    self.reprinter.between(query["from"][0], query["to"][0])
+                    if self.reprinter
+                    else []
+                )
+            case ["admin", "reprint"] if "session" in query:
+                self._reprint(self.reprinter.sessions(query["session"]) if self.reprinter else [])
+            case _:
+                self.send_error(HTTPStatus.NOT_FOUND)
+
+    def _reprint(self, sheets: list[tuple[str, Path]]) -> None:
+        if not sheets:
+            self.send_error(HTTPStatus.NOT_FOUND, "No printable sheets")
+            return
+        if self.reprinter.schedule(sheets) is None:
+            self.send_error(HTTPStatus.SERVICE_UNAVAILABLE)
+            return
+        self.send_response(HTTPStatus.ACCEPTED)
+        body = json.dumps({"queued": [session_id for session_id, _ in sheets]}).encode()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, send_body: bool) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+        try:
+            match parts:
+                case []:
+                    self._send_index(query, send_body)
+                case ["api", "sheets"]:
+                    self._send_json(self._page(query), send_body)
+                case ["sheets", session_id]:
+                    self._send_file(self._sheet_path(session_id), send_body)
+                case ["thumbs", size, session_id] if size.isdigit():
+                    self._send_thumb(session_id, int(size), send_body)
+                case _:
+                    self.send_error(HTTPStatus.NOT_FOUND)
+        except FileNotFoundError:
+            self.send_error(HTTPStatus.NOT_FOUND)
+
+    def _page(self, query: dict[str, list[str]]) -> dict:
+        try:
+            page = max(1, int(query.get("page", ["1"])[0]))
+            per_page = min(100, max(1, int(query.get("per_page", [self.per_page])[0])))
+        except ValueError:
+            page, per_page = 1, self.per_page
+        total = self.catalog.count_sheets()
+        sheets = self.catalog.sheets(per_page, (page - 1) * per_page)
+        return {
+            "page": page,
+            "pages": max(1, math.ceil(total / per_page)),
+            "total": total,
+            "items": [
+                {
+                    "id": sheet["id"],
+                    "taken_at": sheet["started_at"],
+                    "url": f"/sheets/{sheet['id']}",
+                    "thumbs": {
+                        size: f"/thumbs/{size}/{sheet['id']}"
+                        for size in self.thumbnails.sizes
+                    },
+                }
+                for sheet in sheets
+            ],
+        }
+
+    def _sheet_path(self, session_id: str) -> Path:
+        session = self.catalog.session(session_id)
+        if not session or not session["sheet_path"]:
+            raise FileNotFoundError(session_id)
+        return Path(session["sheet_path"])
+
+    def _send_thumb(self, session_id: str, size: int, send_body: bool) -> None:
+        if size not in self.thumbnails.sizes:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        try:
+            thumb = self.thumbnails.get(self._sheet_path(session_id), size)
+        except ValueError:
+            # foglio fuori dalla cartella delle foto (archiviato o spostato): niente miniatura
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        self._send_file(thumb, send_body)
+
+    def _send_index(self, query: dict[str, list[str]], send_body: bool) -> None:
+        page = self._page(query)
+        size = min(self.thumbnails.sizes)
+        items = "".join(
+            f'<a href="{item["url"]}"><img src="{item["thumbs"][size]}" loading="lazy" '
+            f'alt="{html.escape(time.strftime("%d/%m/%Y %H:%M", time.localtime(item["taken_at"])))}"></a>'
+            for item in page["items"]
+        )
+        nav = " ".join(
+            f'<a href="/?page={n}">{n}</a>' if n != page["page"] else f"<b>{n}</b>"
+            for n in range(1, page["pages"] + 1)
+        )
+        body = (
+            f"<!doctype html><html><head><meta charset='utf-8'>"
+            f"<meta name='viewport' content='width=device-width'>"
+            f"<title>{html.escape(_config.get('app.name'))}</title></head>"
+            f"<body>{items}<p>{nav}</p></body></html>"
+        ).encode()
+        self._send_bytes(body, "text/html; charset=utf-8", send_body)
+
+    def _send_json(self, data: dict, send_body: bool) -> None:
+        self._send_bytes(json.dumps(data).encode(), "application/json", send_body)
+
+    def _send_bytes(self, body: bytes, content_type: str, send_body: bool) -> None:
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _parse_range(self, size: int) -> tuple[int, int] | None:
+        match = _RANGE_RE.match(self.headers.get("Range", "").strip())
+        if not match or not any(match.groups()):
+            return None
+        start, end = match.groups()
+        if not start:
+            # suffisso: gli ultimi N byte
+            return max(0, size - int(end)), size - 1
+        return int(start), min(int(end), size - 1) if end else size - 1
+
+    def _send_file(self, path: Path, send_body: bool) -> None:
+        stat = path.stat()
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        size = stat.st_size
+        byte_range = None
+        if self.headers.get("If-Range", etag) == etag:
+            byte_range = self._parse_range(size)
+        if byte_range and byte_range[0] > byte_range[1]:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.end_headers()
+            return
+
+        start, end = byte_range if byte_range else (0, size - 1)
+        length = end - start + 1
+        self.send_response(HTTPStatus.PARTIAL_CONTENT if byte_range else HTTPStatus.OK)
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "public, max-age=86400")
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not send_body:
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            while length > 0:
+                chunk = f.read(min(_CHUNK_SIZE, length))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                length -= len(chunk)
+
+
+class GalleryServer:
+    """Server HTTP locale per scaricare i fogli dal telefono."""
+
+    def __init__(
+        self,
+        catalog: PhotoCatalog,
+        thumbnails: ThumbnailCache,
+        reprinter: Reprinter | None = None,
+        host: str = _config.get("gallery.host", "0.0.0.0"),
+        port: int = _config.get("gallery.port", 8080),
+        workers: int = _config.get("gallery.workers", 2),
+        niceness: int = _config.get("gallery.niceness", 10),
+    ) -> None:
+        handler = type(
+            "GalleryHandler",
+            (_GalleryHandler,),
+            {
+                "catalog": catalog,
+                "thumbnails": thumbnails,
+                "reprinter": reprinter,
+                "admin_hosts": _config.get("gallery.admin_hosts", ["127.0.0.1", "::1"]),
+                "per_page": _config.get("gallery.per_page", 24),
+            },
+        )
+        self._server = _BoundedHTTPServer((host, port), handler, workers, niceness)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="GalleryServer", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+        host, port = self._server.server_address[:2]
+        _logger.info(f"Gallery available at http://{host}:{port}/")
+
+    def stop(self) -> None:
+        if self._thread.is_alive():
+            self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,49 @@
+import time
+
+from core.config import _config
+from core.logger import _logger
+from core.manager.camera_manager import CameraManager
+
+
+class IdleManager:
+    """Sospende la fotocamera dopo un periodo di inattività e la riattiva all'arrivo di un gettone.
+
+    Durante l'inattività anche il polling di gui e pin rallenta.
+    """
+
+    def __init__(
+        self,
+        camera: CameraManager,
+        timeout_sec: float = _config.get("power.idle_timeout_min", 10) * 60,
+        poll_ms: int = _config.get("power.poll_ms", 10),
+        idle_poll_ms: int = _config.get("power.idle_poll_ms", 100),
+    ) -> None:
+        self._camera = camera
+        self._timeout = timeout_sec
+        self._poll = poll_ms / 1000
+        self._idle_poll = idle_poll_ms / 1000
+        self._last_activity = time.monotonic()
+        self._suspended = False
+
+    @property
+    def poll_interval(self) -> float:
+        return self._idle_poll if self._suspended else self._poll
+
+    def activity(self) -> None:
+        self._last_activity = time.monotonic()
+
+    def tick(self) -> None:
+        if self._suspended or self._timeout <= 0:
+            return
+        if time.monotonic() - self._last_activity >= self._timeout:
+            _logger.info(f"No activity for {self._timeout / 60:.0f} min, suspending")
+            self._suspended = True
+            self._camera.suspend()
+
+    def wake(self) -> None:
+        """Riapertura speculativa: la fotocamera si scalda mentre l'utente preme il pulsante."""
+        self.activity()
+        if not self._suspended:
+            return
+        self._suspended = False
+        self._camera.resume_async()
@@ -1,11 +1,15 @@
-from pathlib import Path
-from typing import Any
-import PIL.Image
-import pygame as pg
-import math
-import cv2
+from __future__ import annotations
 
-from core import string_utils
+from typing import Any, BinaryIO, Callable
+import struct
+import zlib
+
+from core.startup import lazy_import
+
+PIL = lazy_import("PIL.Image")
+pg = lazy_import("pygame")
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
 
 _Size = tuple[int, int]
 
@@ -18,6 +22,23 @@ def cv2_to_PIL(image: Any) -> PIL.Image.Image:
     return PIL.Image.fromarray(color_converted)
 
 
+def resize_to_PIL(
+    image: PIL.Image.Image | Any,
+    size: _Size,
+    grade: Callable[[Any], Any] | None = None,
+) -> PIL.Image.Image:
+    """Ridimensiona un'immagine PIL o un ndarray BGR senza copiarlo a piena risoluzione.
+
+    `grade` viene applicato in place al fotogramma BGR già ridimensionato.
+    """
+    if isinstance(image, PIL.Image.Image):
+        return image.resize(size)
+    resized = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    if grade:
+        grade(resized)
+    return PIL.Image.fromarray(cv2.cvtColor(resized, cv2.COLOR_BGR2RGB))
+
+
 def pil_to_pygame(image: PIL.Image.Image) -> pg.Surface:
     if image.mode != "RGB":
         image = image.convert("RGB")
@@ -51,46 +72,43 @@ def scale_surface(surface: pg.Surface, scale: float) -> tuple[pg.Surface, _Size]
     return pg.transform.smoothscale(surface, scaled_size), scaled_size
 
 
-def save_pic(image: PIL.Image.Image, path: Path, prefix: str, extension: str) -> None:
-    filename = string_utils.generate_valid_filename(
-        path,
-        prefix,
-        extension,
-    )
-    image.save(str(filename.resolve()))
-    return filename
-
-
-def merge_pics(
-    merged_size: _Size,
-    pics: tuple[PIL.Image.Image],
-    margins: tuple[float, float, float, float],
-    pics_spacing: float,
-    qt_x_row: float = 2,
-) -> PIL.Image.Image:
-    """Handles correctly 1, 3 and 4, ... pictures."""
-    qt_x_row = max(1, qt_x_row)
-    w = int(
-        (merged_size[0] - margins[1] - margins[3] - pics_spacing * (qt_x_row - 1))
-        / qt_x_row
-    )
-    h = int(
-        (merged_size[1] - margins[0] - margins[2] - pics_spacing * (qt_x_row - 1))
-        / qt_x_row
-    )
-    resized = []
-    merged_size = [int(s) for s in merged_size]
-    merged = PIL.Image.new("RGB", merged_size, "white")
-    y = margins[0]
-    rows = math.ceil(len(pics) / qt_x_row)
-    for i in range(rows):
-        x = margins[3]
-        col_start = math.ceil(i * len(pics) / qt_x_row)
-        col_end = math.ceil((i + 1) * len(pics) / qt_x_row)
-        for pic in pics[col_start:col_end]:
-            res = pic.resize((w, h))
-            resized.append(res)
-            merged.paste(res, (int(x), int(y)))
-            x += w + pics_spacing
-        y += h + pics_spacing
-    return merged
+def save_pic(image: PIL.Image.Image, file: BinaryIO, extension: str) -> None:
+    image_format = PIL.Image.registered_extensions().get(f".{extension.lower()}")
+    image.save(file, format=image_format)
+
+
+class PngStripWriter:
+    """Encoder PNG a strisce: le righe vengono compresse e scritte man mano.
+
+    La memoria usata dipende dall'altezza della striscia, non dal foglio.
+    """
+
+    def __init__(self, file: BinaryIO, size: _Size, level: int = 3) -> None:
+        self._file = file
+        self._width, self._height = size
+        self._rows = 0
+        self._zlib = zlib.compressobj(level)
+        file.write(b"\x89PNG\r\n\x1a\n")
+        # RGB a 8 bit, senza interlacciamento
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", self._width, self._height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(kind)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, strip: Any) -> None:
+        """Aggiunge una striscia RGB (ndarray altezza x larghezza x 3)."""
+        # filtro 0 (nessuno) all'inizio di ogni riga
+        rows = strip.reshape(strip.shape[0], -1)
+        data = np.hstack((np.zeros((len(rows), 1), np.uint8), rows)).tobytes()
+        self._rows += strip.shape[0]
+        if compressed := self._zlib.compress(data):
+            self._chunk(b"IDAT", compressed)
+
+    def close(self) -> None:
+        if self._rows != self._height:
+            raise ValueError(f"PNG has {self._rows} rows, expected {self._height}")
+        self._chunk(b"IDAT", self._zlib.flush())
+        self._chunk(b"IEND", b"")
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from pathlib import Path
+import queue
+import shutil
+import threading
+import time
+from typing import Any
+
+from core.config import _config
+from core.frame_pool import Frame
+from core.logger import _logger
+from core.startup import lazy_import
+
+cv2 = lazy_import("cv2")
+
+
+class Stage:
+    STARTED = "started"
+    FRAME = "frame"
+    SHEET = "sheet"
+    PRINT = "print"
+    DONE = "done"
+    CLOSED = "closed"
+
+
+class JournaledSession:
+    """Sessione rimasta aperta nel giornale: quanto era stato salvato prima dell'interruzione."""
+
+    def __init__(self, session_id: str, booth: str, started_at: float) -> None:
+        self.id = session_id
+        self.booth = booth
+        self.started_at = started_at
+        self.frames: dict[int, Path] = {}
+        self.sheet: Path | None = None
+        # stampa accodata ma non conclusa prima dell'interruzione
+        self.print_job: str | None = None
+
+    def frame_paths(self, count: int) -> list[Path] | None:
+        """Le `count` foto in ordine, se sono state salvate tutte."""
+        paths = [self.frames.get(i) for i in range(1, count + 1)]
+        if all(path is not None and path.is_file() for path in paths):
+            return paths
+        return None
+
+    def resumable(self, count: int) -> bool:
+        """Vero se il foglio può essere stampato senza rifare le foto."""
+        if self.sheet is not None and self.sheet.is_file():
+            return True
+        return self.frame_paths(count) is not None
+
+
+class SessionJournal:
+    """Giornale append-only delle sessioni, per riprenderle dopo un crash.
+
+    Ogni passaggio (gettone, foto salvata, foglio, stampa) è una riga JSON;
+    le righe vengono accodate e scritte a blocchi da un thread dedicato, con
+    un solo `fsync` per blocco. Le foto sorgente vengono salvate su disco da un
+    worker e registrate solo dopo la scrittura, quindi ogni riga `frame` punta
+    a un file completo. All'avvio `recover()` restituisce le sessioni aperte.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        frames_dir: Path,
+        enabled: bool = _config.get("journal.enabled", True),
+        batch_size: int = _config.get("journal.batch_size", 32),
+        flush_interval: float = _config.get("journal.flush_ms", 200) / 1000,
+        quality: int = _config.get("journal.frame_quality", 90),
+    ) -> None:
+        self._path = Path(path)
+        self._frames_dir = Path(frames_dir)
+        self.enabled = enabled
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._quality = quality
+        self._queue: queue.Queue[dict[str, Any] | threading.Event | None] = queue.Queue()
+        self._encoder = (
+            ThreadPoolExecutor(1, thread_name_prefix="JournalFrames") if enabled else None
+        )
+        self._writer: threading.Thread | None = None
+
+    def _read(self) -> list[dict[str, Any]]:
+        records = []
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # ultima riga troncata dal crash
+                        _logger.warning(f"Skipping corrupted journal line in {self._path}")
+        except FileNotFoundError:
+            pass
+        return records
+
+    def recover(self) -> list[JournaledSession]:
+        """Sessioni aperte al momento dell'ultima chiusura; poi avvia la scrittura.
+
+        Il giornale viene compattato lasciando solo le righe delle sessioni
+        aperte, e le foto delle sessioni concluse vengono eliminate.
+        """
+        sessions: dict[str, JournaledSession] = {}
+        kept: list[dict[str, Any]] = []
+        if self.enabled:
+            records = self._read()
+            for record in records:
+                session_id, stage = record["session"], record["stage"]
+                if stage == Stage.STARTED:
+                    sessions[session_id] = JournaledSession(
+                        session_id, record["booth"], record["t"]
+                    )
+                elif stage in (Stage.DONE, Stage.CLOSED):
+                    sessions.pop(session_id, None)
+                elif (session := sessions.get(session_id)) is None:
+                    continue
+                elif stage == Stage.FRAME:
+                    session.frames[record["idx"]] = Path(record["path"])
+                elif stage == Stage.SHEET:
+                    session.sheet = Path(record["path"])
+                elif stage == Stage.PRINT:
+                    session.print_job = record["job"]
+            kept = [record for record in records if record["session"] in sessions]
+            self._compact(kept)
+            if self._frames_dir.is_dir():
+                for folder in self._frames_dir.iterdir():
+                    if folder.name not in sessions:
+                        shutil.rmtree(folder, ignore_errors=True)
+            if sessions:
+                _logger.warning(f"{len(sessions)} interrupted session(s) found in the journal")
+            self._writer = threading.Thread(
+                target=self._write_loop, name="JournalWriter", daemon=True
+            )
+            self._writer.start()
+        return list(sessions.values())
+
+    def _compact(self, records: list[dict[str, Any]]) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path)
+
+    # scrittura
+
+    def _write_loop(self) -> None:
+        with open(self._path, "a", encoding="utf-8") as f:
+            running = True
+            while running:
+                lines: list[str] = []
+                waiters: list[threading.Event] = []
+                item = self._queue.get()
+                deadline = time.monotonic() + self._flush_interval
+                while item is not None:
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                        break
+                    lines.append(json.dumps(item) + "\n")
+                    if len(lines) >= self._batch_size:
+                        break
+                    try:
+                        item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                running = item is not None
+                try:
+                    f.writelines(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                except OSError as e:
+                    _logger.error(f"Journal write failed ({len(lines)} records): {e}")
+                for waiter in waiters:
+                    waiter.set()
+
+    def record(self, session_id: str, stage: str, **data: Any) -> None:
+        if self.enabled:
+            self._queue.put_nowait({"t": time.time(), "session": session_id, "stage": stage, **data})
+
+    def start(self, session_id: str, booth: str) -> None:
+        self.record(session_id, Stage.STARTED, booth=booth)
+
+    def _save_frame(self, session_id: str, idx: int, frame: Frame, path: Path) -> None:
+        # nessuno attende il risultato: gli errori vanno registrati qui
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if cv2.imwrite(str(path), frame.data, [cv2.IMWRITE_JPEG_QUALITY, self._quality]):
+                self.record(session_id, Stage.FRAME, idx=idx, path=str(path))
+            else:
+                _logger.error(f"Can't save journal frame {path}")
+        except Exception as e:
+            _logger.error(f"Can't save journal frame {path}: {e}")
+        finally:
+            frame.release()
+
+    def save_frame(self, session_id: str, idx: int, frame: Frame) -> Path | None:
+        """Salva la foto in background; il fotogramma resta trattenuto fino alla scrittura."""
+        if not self.enabled:
+            return None
+        path = self._frames_dir / session_id / f"{idx}.jpg"
+        self._encoder.submit(self._save_frame, session_id, idx, frame.retain(), path)
+        return path
+
+    def sheet(self, session_id: str, path: Path) -> None:
+        self.record(session_id, Stage.SHEET, path=str(path))
+
+    def print_job(self, session_id: str, print_id: str) -> None:
+        self.record(session_id, Stage.PRINT, job=print_id)
+
+    def _discard_frames(self, session_id: str) -> None:
+        shutil.rmtree(self._frames_dir / session_id, ignore_errors=True)
+
+    def done(self, session_id: str) -> None:
+        """Sessione stampata: le foto sorgente non servono più."""
+        self.close(session_id, Stage.DONE)
+
+    def close(self, session_id: str, stage: str = Stage.CLOSED, **data: Any) -> None:
+        if self.enabled:
+            self.record(session_id, stage, **data)
+            # dopo le scritture delle foto ancora in coda per la stessa sessione
+            self._encoder.submit(self._discard_frames, session_id)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Attende che le righe accodate finora siano su disco."""
+        if self._writer is None:
+            return True
+        done = threading.Event()
+        self._queue.put_nowait(done)
+        return done.wait(timeout)
+
+    def stop(self) -> None:
+        if self._encoder is not None:
+            self._encoder.shutdown(wait=True)
+        if self._writer is not None:
+            self._queue.put_nowait(None)
+            self._writer.join()
@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import math
+from pathlib import Path
+import threading
+import time
+import tomllib
+from typing import Any, BinaryIO, Callable
+
+from core.config import _config
+from core.exceptions import ConfigLookupError, InvalidLayoutError
+from core.image_utils import PngStripWriter, cm_to_px, resize_to_PIL
+from core.logger import _logger
+from core.startup import lazy_import
+
+PIL = lazy_import("PIL.Image")
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+_Size = tuple[int, int]
+# x, y, larghezza, altezza in pixel del foglio
+_Box = tuple[int, int, int, int]
+
+
+class Slot:
+    """Posizione di una foto sul foglio, con la maschera già calcolata se è ruotata."""
+
+    def __init__(self, box: _Box, angle: float = 0) -> None:
+        x, y, w, h = box
+        self.size: _Size = (w, h)
+        self.angle = angle
+        self.mask: PIL.Image.Image | None = None
+        self.matrix: Any = None
+        self.position = (x, y)
+        # ingombro sul foglio, più grande della foto se è ruotata
+        self.extent: _Size = (w, h)
+        if angle:
+            # rotazione attorno al centro, dentro il riquadro che contiene la foto ruotata
+            rad = math.radians(angle)
+            cos, sin = abs(math.cos(rad)), abs(math.sin(rad))
+            rotated = (math.ceil(w * cos + h * sin), math.ceil(w * sin + h * cos))
+            self._rotated_size = self.extent = rotated
+            self.matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1)
+            self.matrix[0, 2] += (rotated[0] - w) / 2
+            self.matrix[1, 2] += (rotated[1] - h) / 2
+            # bordi antialias: la maschera ha gli stessi pixel della foto ruotata
+            self.mask_array = self.rotate(np.full((h, w), 255, np.uint8))
+            self.mask = PIL.Image.fromarray(self.mask_array)
+            self.position = (
+                int(x + w / 2 - rotated[0] / 2),
+                int(y + h / 2 - rotated[1] / 2),
+            )
+
+    def rotate(self, image: Any) -> Any:
+        return cv2.warpAffine(image, self.matrix, self._rotated_size, flags=cv2.INTER_LINEAR)
+
+
+def _blend(top: Any, bottom: Any, alpha: Any) -> Any:
+    """`top` sopra `bottom` con opacità `alpha` (0-255, un canale), come `Image.paste`."""
+    alpha = alpha.astype(np.uint16)
+    mixed = top * alpha + bottom * (255 - alpha) + 127
+    return (mixed // 255).astype(np.uint8)
+
+
+def _paste(strip: Any, y0: int, image: Any, mask: Any, x: int, y: int) -> None:
+    """Incolla la parte di `image` (in posizione `x`, `y` sul foglio) che cade nella striscia."""
+    h, w = strip.shape[:2]
+    top, bottom = max(y, y0), min(y + image.shape[0], y0 + h)
+    left, right = max(x, 0), min(x + image.shape[1], w)
+    if top >= bottom or left >= right:
+        return
+    dst = strip[top - y0 : bottom - y0, left:right]
+    src = image[top - y : bottom - y, left - x : right - x]
+    if mask is None:
+        dst[:] = src
+    else:
+        dst[:] = _blend(src, dst, mask[top - y : bottom - y, left - x : right - x, None])
+
+
+class Layout:
+    """Modello compilato per una dimensione del foglio.
+
+    Sfondo e immagini fisse sono già disegnati in `base`, la cornice è un
+    livello RGBA grande quanto il foglio: per ogni sessione restano solo una
+    copia, un incolla per foto e una composizione alfa.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base: PIL.Image.Image,
+        slots: list[Slot],
+        frame: PIL.Image.Image | None,
+    ) -> None:
+        self.name = name
+        self.slots = slots
+        self._base = base
+        self._frame = frame
+
+    @property
+    def size(self) -> _Size:
+        return self._base.size
+
+    def render(
+        self, pics: list[PIL.Image.Image | Any], grade: Callable[[Any], Any] | None = None
+    ) -> PIL.Image.Image:
+        if len(pics) > len(self.slots):
+            _logger.warning(
+                f"Layout {self.name} has {len(self.slots)} slots, {len(pics) - len(self.slots)} photos left out"
+            )
+        sheet = self._base.copy()
+        for pic, slot in zip(pics, self.slots):
+            if slot.mask is None:
+                image = resize_to_PIL(pic, slot.size, grade)
+            else:
+                if isinstance(pic, PIL.Image.Image):
+                    pic = cv2.cvtColor(np.asarray(pic.convert("RGB")), cv2.COLOR_RGB2BGR)
+                resized = cv2.resize(pic, slot.size, interpolation=cv2.INTER_AREA)
+                if grade:
+                    grade(resized)
+                rotated = cv2.cvtColor(slot.rotate(resized), cv2.COLOR_BGR2RGB)
+                image = PIL.Image.fromarray(rotated)
+            sheet.paste(image, slot.position, slot.mask)
+        if self._frame is not None:
+            sheet.paste(self._frame, (0, 0), self._frame)
+        return sheet
+
+    def _slot_image(
+        self, slot: Slot, pic: PIL.Image.Image | Any, grade: Callable[[Any], Any] | None
+    ) -> tuple[Any, Any]:
+        if isinstance(pic, PIL.Image.Image):
+            pic = cv2.cvtColor(np.asarray(pic.convert("RGB")), cv2.COLOR_RGB2BGR)
+        image = cv2.resize(pic, slot.size, interpolation=cv2.INTER_AREA)
+        if grade:
+            grade(image)
+        mask = None
+        if slot.mask is not None:
+            image, mask = slot.rotate(image), slot.mask_array
+        # conversione sul posto: niente seconda copia dello slot
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image), mask
+
+    def stream(
+        self,
+        pics: list[PIL.Image.Image | Any],
+        file: BinaryIO,
+        grade: Callable[[Any], Any] | None = None,
+        strip_height: int = _config.get("photo.stream.strip_height", 256),
+        level: int = _config.get("photo.stream.png_level", 3),
+        preview_width: int = _config.get("photo.stream.preview_width", 1200),
+    ) -> PIL.Image.Image:
+        """Compone e codifica il foglio in PNG una striscia alla volta; restituisce un'anteprima.
+
+        Ogni foto viene ridimensionata quando la prima striscia la raggiunge e
+        scartata dopo l'ultima: oltre al modello compilato, la memoria dipende
+        dall'altezza della striscia e dagli slot che la attraversano.
+        """
+        w, h = self.size
+        scale = min(1, preview_width / w)
+        preview = np.empty((max(1, round(h * scale)), max(1, round(w * scale)), 3), np.uint8)
+        writer = PngStripWriter(file, (w, h), level)
+        placed = list(zip(pics, self.slots))
+        ready: dict[int, tuple[Any, Any]] = {}
+        for y0 in range(0, h, strip_height):
+            y1 = min(h, y0 + strip_height)
+            # solo la striscia del fondo e della cornice diventa un ndarray
+            strip = np.array(self._base.crop((0, y0, w, y1)))
+            for i, (pic, slot) in enumerate(placed):
+                x, y = slot.position
+                if y + slot.extent[1] <= y0:
+                    # già scritta tutta: il ridimensionamento non serve più
+                    ready.pop(i, None)
+                    continue
+                if y >= y1:
+                    continue
+                if i not in ready:
+                    ready[i] = self._slot_image(slot, pic, grade)
+                image, mask = ready[i]
+                _paste(strip, y0, image, mask, x, y)
+            if self._frame is not None:
+                frame = np.asarray(self._frame.crop((0, y0, w, y1)))
+                strip = _blend(frame[..., :3], strip, frame[..., 3:])
+            writer.write(strip)
+            p0, p1 = round(y0 * scale), round(y1 * scale)
+            if p1 > p0:
+                preview[p0:p1] = cv2.resize(
+                    strip, (preview.shape[1], p1 - p0), interpolation=cv2.INTER_AREA
+                )
+        writer.close()
+        return PIL.Image.fromarray(preview)
+
+
+def _image_path(ref: str) -> Path:
+    # chiave di [paths.images] o percorso di un file
+    try:
+        return Path(_config.get("paths.folders.images")) / _config.get_path(ref)
+    except ConfigLookupError:
+        return Path(ref)
+
+
+def _open_image(ref: str) -> PIL.Image.Image:
+    try:
+        image = PIL.Image.open(_image_path(ref))
+        image.load()
+        return image
+    except OSError as e:
+        raise InvalidLayoutError(f"Can't load layout image {ref}: {e}") from e
+
+
+def _box(spec: dict[str, float], size: _Size) -> _Box:
+    try:
+        return (
+            round(spec["x"] * size[0]),
+            round(spec["y"] * size[1]),
+            round(spec["w"] * size[0]),
+            round(spec["h"] * size[1]),
+        )
+    except (KeyError, TypeError) as e:
+        raise InvalidLayoutError(f"Invalid layout box {spec}: {e}") from e
+
+
+def _windows(alpha: Any, min_area: float) -> list[_Box]:
+    """Aree trasparenti della cornice, dall'alto in basso e da sinistra a destra."""
+    transparent = (np.asarray(alpha) < 128).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(transparent, connectivity=4)
+    boxes = [
+        tuple(int(v) for v in stats[i, :4])
+        for i in range(1, count)
+        if stats[i, cv2.CC_STAT_AREA] >= min_area * alpha.size[0] * alpha.size[1]
+    ]
+    return sorted(boxes, key=lambda box: (box[1], box[0]))
+
+
+def _grid_spec(size: _Size) -> dict[str, Any]:
+    """Il foglio classico: griglia di `pics_per_row` colonne, con il watermark nella prima cella."""
+    dpi = _config.get("usb.printer.dpi")
+    top, right, bottom, left = cm_to_px(_config.get("usb.printer.sheet_margins"), dpi)
+    spacing = cm_to_px([_config.get("usb.printer.pics_spacing")], dpi)[0]
+    per_row = max(1, _config.get("usb.printer.pics_per_row"))
+    cells = _config.get("photo.count") + 1
+    w = int((size[0] - left - right - spacing * (per_row - 1)) / per_row)
+    h = int((size[1] - top - bottom - spacing * (per_row - 1)) / per_row)
+    boxes = [
+        {
+            "x": int(left + (i % per_row) * (w + spacing)) / size[0],
+            "y": int(top + (i // per_row) * (h + spacing)) / size[1],
+            "w": w / size[0],
+            "h": h / size[1],
+        }
+        for i in range(math.ceil(cells / per_row) * per_row)
+    ]
+    return {
+        "background": "white",
+        # incollato opaco come nel foglio originale
+        "images": [{"image": "watermark", "mask": False, **boxes[0]}],
+        "slots": boxes[1:cells],
+    }
+
+
+def _load_spec(name: str, size: _Size) -> dict[str, Any]:
+    if name == "grid":
+        return _grid_spec(size)
+    if (spec := _config.get(f"layouts.{name}")) is not None:
+        return spec
+    path = Path(_config.get("paths.folders.layouts", "layouts")) / f"{name}.toml"
+    try:
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        raise InvalidLayoutError(f"Layout '{name}' not found in [layouts] or {path}: {e}") from e
+
+
+def compile_layout(name: str, size: _Size) -> Layout:
+    started = time.perf_counter()
+    spec = _load_spec(name, size)
+    size = (int(size[0]), int(size[1]))
+    base = PIL.Image.new("RGB", size, spec.get("background", "white"))
+    for image in spec.get("images", []):
+        x, y, w, h = _box(image, size)
+        if image.get("mask", True):
+            source = _open_image(image["image"]).convert("RGBA").resize((w, h))
+            base.paste(source, (x, y), source)
+        else:
+            base.paste(_open_image(image["image"]).resize((w, h)), (x, y))
+    frame = None
+    if spec.get("overlay"):
+        frame = _open_image(spec["overlay"]).convert("RGBA").resize(size)
+    slots = [Slot(_box(slot, size), slot.get("angle", 0)) for slot in spec.get("slots", [])]
+    if not slots and frame is not None:
+        # nessuno slot dichiarato: le foto vanno nelle finestre trasparenti della cornice
+        boxes = _windows(frame.getchannel("A"), spec.get("min_window", 0.01))
+        slots = [Slot(box) for box in boxes]
+    if not slots:
+        raise InvalidLayoutError(f"Layout '{name}' has no photo slots")
+    _logger.debug(
+        f"Layout {name} compiled for {size} in {(time.perf_counter() - started) * 1000:.0f} ms ({len(slots)} slots)"
+    )
+    return Layout(name, base, slots, frame)
+
+
+class LayoutRegistry:
+    """Modello in uso, compilato alla prima richiesta e dopo ogni `Config.reload()`.
+
+    Senza `name` il modello è quello di `photo.layout`, riletto a ogni ricaricamento.
+    """
+
+    def __init__(self, name: str | None = None) -> None:
+        self._fixed = name
+        self._name = name or _config.get("photo.layout", "grid")
+        self._lock = threading.Lock()
+        self._compiled: dict[_Size, Layout] = {}
+        self._version = _config.version
+
+    def get(self, size: _Size) -> Layout:
+        size = (int(size[0]), int(size[1]))
+        with self._lock:
+            if self._version != _config.version:
+                self._version = _config.version
+                self._name = self._fixed or _config.get("photo.layout", "grid")
+                self._compiled.clear()
+            if size not in self._compiled:
+                self._compiled[size] = compile_layout(self._name, size)
+            return self._compiled[size]
@@ -1,19 +1,144 @@
 from pathlib import Path
+import atexit
+import copy
 import logging
-from rich.logging import RichHandler
+import logging.handlers
+import multiprocessing
+import queue
+import time
 
 from core.config import _config
 
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Accoda i record senza formattarli: il rendering avviene nel listener."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # la coda è in-process: non serve rendere il record serializzabile,
+        # basta fissare il messaggio e lasciare exc_info ai gestori a valle
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class _RotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Ruota il file al superamento di max_bytes o allo scadere dell'intervallo."""
+
+    def __init__(
+        self, filename: Path, max_bytes: int, backup_count: int, interval_sec: float
+    ) -> None:
+        super().__init__(
+            filename,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding="utf-8",
+            delay=True,
+        )
+        self._interval_sec = interval_sec
+        self._rollover_at = self._compute_rollover()
+
+    def _compute_rollover(self) -> float:
+        if self._interval_sec <= 0:
+            return float("inf")
+        return time.time() + self._interval_sec
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self._rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self._rollover_at = self._compute_rollover()
+
+
+class _ConsoleHandler(logging.Handler):
+    """Console semplice durante l'avvio, `rich` dopo `use_rich_console()`.
+
+    `rich` viene importato dal thread del listener al primo record successivo,
+    fuori dal percorso di avvio.
+    """
+
+    def __init__(self, formatter: logging.Formatter) -> None:
+        super().__init__()
+        self._formatter = formatter
+        self._plain = logging.StreamHandler()
+        self._plain.setFormatter(formatter)
+        self._rich: logging.Handler | None = None
+        self.rich_enabled = False
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.rich_enabled and self._rich is None:
+            from rich.logging import RichHandler
+
+            self._rich = RichHandler(rich_tracebacks=True, show_path=False, markup=True)
+            self._rich.setFormatter(self._formatter)
+        (self._rich or self._plain).emit(record)
+
+
+_console: _ConsoleHandler | None = None
+
+
+def _console_handler() -> logging.Handler:
+    global _console
+    _console = _ConsoleHandler(logging.Formatter(_config.get("logging.format")))
+    return _console
+
+
+def use_rich_console() -> None:
+    """Da chiamare dopo la prima schermata: da qui in poi la console usa `rich`."""
+    if _console is not None:
+        _console.rich_enabled = True
+
+
+def _file_handler() -> logging.Handler:
+    folder = Path(_config.get("paths.folders.logs", "logs"))
+    folder.mkdir(parents=True, exist_ok=True)
+    handler = _RotatingFileHandler(
+        folder / Path(f"{_config.get('app.name').lower()}.log"),
+        int(_config.get("logging.file.max_bytes", 0)),
+        int(_config.get("logging.file.backup_count", 0)),
+        float(_config.get("logging.file.rotate_hours", 0)) * 3600,
+    )
+    handler.setFormatter(logging.Formatter(_config.get("logging.file.format")))
+    return handler
+
+
+def _build_handlers() -> list[logging.Handler]:
+    handlers = []
+    if _config.get("logging.console", True):
+        handlers.append(_console_handler())
+    # i processi figli (encoder, acquisizione) non scrivono sul file ruotato
+    is_child = multiprocessing.parent_process() is not None
+    if _config.get("logging.file.enabled", False) and not is_child:
+        handlers.append(_file_handler())
+    return handlers
+
+
+_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+_listener = logging.handlers.QueueListener(
+    _queue, *_build_handlers(), respect_handler_level=True
+)
+
 logging.basicConfig(
     level=_config.get("logging.level"),
-    format=_config.get("logging.format"),
-    handlers=[
-        RichHandler(rich_tracebacks=True, show_path=False, markup=True),
-        # logging.FileHandler(
-        #     Path(_config.get("paths.logs_folder"))
-        #     / Path(_config.get("app.name").lower())
-        # ),
-    ],
+    handlers=[_QueueHandler(_queue)],
 )
 
 _logger = logging.getLogger(_config.get("app.name"))
+
+_listener.start()
+_listener_running: bool = True
+
+
+def stop_logging() -> None:
+    """Svuota la coda dei log e ferma il thread del listener."""
+    global _listener_running
+    if not _listener_running:
+        return
+    _listener_running = False
+    _listener.stop()
+
+
+atexit.register(stop_logging)
@@ -1,30 +1,80 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
 import platform
-import PIL
-import PIL.Image
-import cv2
 import queue
+import threading
+import time
+from typing import Any, Callable
 
 from core.exceptions import (
+    CameraError,
     CameraNotReadyError,
     CannotTakePictureError,
+    CaptureCancelledError,
     InvalidCameraIndexError,
 )
+from core.burst import BurstScorer
+from core.capture_process import SharedMemoryCapture
+from core.frame_pool import Frame, FramePool
+from core.shutter import Shutter
 from core.utils import System
-from core.image_utils import cv2_to_PIL
 from core.config import _config
 from core.logger import _logger
+from core.startup import lazy_import
+
+cv2 = lazy_import("cv2")
 
 
 class CameraManager:
 
     def __init__(
-        self, camera_id: int = 0, queue_size: int = _config.get("photo.queue_size")
+        self,
+        camera_id: int = 0,
+        queue_size: int = _config.get("photo.queue_size"),
+        burst: int = _config.get("photo.burst.frames", 1),
+        record: bool = _config.get("photo.animation.enabled", False),
+        capture: Callable[[int], Any] | None = None,
     ):
         cv2.setLogLevel(0)
-        self._pics_queue: queue.Queue[PIL.Image.Image] = queue.Queue(queue_size)
+        self._pics_queue: queue.Queue[Frame] = queue.Queue(queue_size)
+        self._burst = max(1, burst)
+        # coda + raffica + ultimo fotogramma valido + margine
+        self._pool = FramePool((0, 0, 3), queue_size + self._burst + 2)
+        self._scorer = BurstScorer() if self._burst > 1 else None
+        self._record = record
+        self._clip: list[Any] = []
+        self._clip_width: int = _config.get("photo.animation.width", 480)
+        self._clip_frames_after: int = _config.get("photo.animation.frames_after", 6)
+        # i fotogrammi dopo lo scatto si leggono fuori dal percorso dello scatto
+        self._clip_reader = ThreadPoolExecutor(1, thread_name_prefix="CameraClip")
+        self._clip_tail: Future | None = None
         self._camera = None
         self._camera_id = camera_id
+        self._capture_process: bool = _config.get("usb.camera.process.enabled", False)
+        self._capture = capture
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+        self._resuming = False
+        self.last_resume_ms: float | None = None
+        # watchdog delle letture
+        self._read_timeout: float = _config.get("usb.camera.read_timeout_ms", 2000) / 1000
+        self._fallback_age: float = _config.get("usb.camera.fallback_max_age_ms", 1000) / 1000
+        self._reader = self._new_reader()
+        self._last_frame: Frame | None = None
+        self.shutter = Shutter()
+        self._metrics = {
+            "read_timeouts": 0,
+            "read_failures": 0,
+            "fallback_frames": 0,
+            "reconnects": 0,
+            "reconnect_ms_last": 0.0,
+            "reconnect_ms_total": 0.0,
+        }
         self._init_camera()
+        self._ready.set()
         self._name = self._get_camera_name(self._camera_id)
         _logger.debug(f"Camera {self._name}({self._camera_id}) opened")
 
@@ -32,19 +82,119 @@ class CameraManager:
         if self._camera and self._camera.isOpened():
             return
 
-        self._camera = cv2.VideoCapture(self._camera_id)
+        self._camera = self._open_capture(self._camera_id)
         if self._camera.isOpened():
+            self._resize_pool()
             return
         else:
             self._camera.release()
         _logger.warning(f"Can't open camera [{self._camera_id}], trying default [0]")
         if self._camera_id != 0:
-            self._camera = cv2.VideoCapture(0)
+            self._camera = self._open_capture(0)
             if self._camera.isOpened():
                 self._camera_id = 0
+                self._resize_pool()
                 return
         raise InvalidCameraIndexError(f"Camera {self._camera_id} not found")
 
+    @property
+    def frame_shape(self) -> tuple[int, int, int]:
+        return self._pool.shape
+
+    def _open_capture(self, camera_id: int) -> Any:
+        if self._capture:
+            return self._capture(camera_id)
+        if self._capture_process:
+            return SharedMemoryCapture(camera_id)
+        return cv2.VideoCapture(camera_id)
+
+    def _resize_pool(self) -> None:
+        w = int(self._camera.get(cv2.CAP_PROP_FRAME_WIDTH))
+        h = int(self._camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if w and h:
+            self._pool.resize((h, w, 3))
+
+    def suspend(self) -> None:
+        """Rilascia il dispositivo durante l'inattività."""
+        with self._lock:
+            if not self._ready.is_set() or self._resuming:
+                return
+            self._ready.clear()
+            self._camera.release()
+            self._camera = None
+        _logger.info(f"Camera {self._camera_id} suspended")
+
+    def resume_async(self) -> None:
+        """Riapre il dispositivo in background, se è sospeso."""
+        self._reopen_async(reconnect=False)
+
+    def _reopen_async(self, reconnect: bool) -> None:
+        with self._lock:
+            if self._resuming or (self._ready.is_set() and not reconnect):
+                return
+            self._resuming = True
+            self._ready.clear()
+            camera, self._camera = self._camera, None
+        threading.Thread(
+            target=self._reopen, args=(camera, reconnect), name="CameraReopen", daemon=True
+        ).start()
+
+    def _reopen(self, camera: Any, reconnect: bool) -> None:
+        started = time.perf_counter()
+        delay: float = _config.get("usb.camera.reconnect_backoff_ms", [250, 8000])[0] / 1000
+        max_delay: float = _config.get("usb.camera.reconnect_backoff_ms", [250, 8000])[1] / 1000
+        if camera is not None:
+            # può bloccarsi se una lettura è ancora appesa: siamo già fuori dal ciclo principale
+            camera.release()
+        while True:
+            try:
+                self._init_camera()
+                break
+            except CameraError as e:
+                _logger.warning(f"Can't reopen camera {self._camera_id}: {e}, retrying in {delay:.1f}s")
+            if self._stopping.wait(delay):
+                with self._lock:
+                    self._resuming = False
+                return
+            delay = min(delay * 2, max_delay)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._resuming = False
+            if reconnect:
+                self._metrics["reconnects"] += 1
+                self._metrics["reconnect_ms_last"] = elapsed_ms
+                self._metrics["reconnect_ms_total"] += elapsed_ms
+            else:
+                self.last_resume_ms = elapsed_ms
+        self._ready.set()
+        action = "reconnected" if reconnect else "resumed"
+        _logger.info(f"Camera {self._camera_id} {action} in {elapsed_ms:.0f} ms")
+        if reconnect:
+            _logger.info(f"Camera metrics: {self.metrics()}")
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        if self._ready.is_set():
+            return True
+        self.resume_async()
+        started = time.perf_counter()
+        ready = self._ready.wait(timeout)
+        _logger.info(
+            f"Waited {(time.perf_counter() - started) * 1000:.0f} ms for camera"
+        )
+        return ready
+
+    def _count(self, metric: str) -> None:
+        # letture e riconnessioni avvengono su thread diversi da chi legge le metriche
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def metrics(self) -> dict[str, float]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics.update({f"pool_{k}": v for k, v in self._pool.stats().items()})
+        metrics.update(self.shutter.stats())
+        return metrics
+
     def _get_windows_camera_name(self, id: int) -> str:
         try:
             import logging
@@ -74,26 +224,238 @@ class CameraManager:
             case System.LINUX:
                 return self._get_linux_camera_name(id)
 
-    def _enqueue_image(self, image: PIL.Image.Image) -> None:
+    def _enqueue_image(self, image: Frame) -> None:
         self._pics_queue.put_nowait(image)
 
-    def pop_pic(self) -> PIL.Image.Image:
+    def pop_pic(self, warn: bool = True) -> Frame | None:
+        """Prossima foto in coda: il chiamante deve rilasciarla con `release()`."""
         try:
             image = self._pics_queue.get_nowait()
         except queue.Empty:
-            _logger.warning("Can't save picture: CameraManager pics queue is empty.")
+            if warn:
+                _logger.warning("Can't save picture: CameraManager pics queue is empty.")
             return None
         return image
 
-    def take_pic(self) -> None:
-        if not self._camera.isOpened():
+    def _new_reader(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(1, thread_name_prefix="CameraReader")
+
+    def _set_last_frame(self, frame: Frame | None) -> None:
+        previous, self._last_frame = self._last_frame, frame
+        if previous:
+            previous.release()
+
+    def _read(self) -> Frame:
+        """Legge un fotogramma in un buffer del pool; va rilasciato con `release()`."""
+        camera = self._camera
+        frame = self._pool.acquire()
+        result, image = False, None
+        if camera is not None and self._ready.is_set():
+            future = self._reader.submit(camera.read, frame.data)
+            try:
+                result, image = future.result(timeout=self._read_timeout)
+            except TimeoutError:
+                # il thread appeso viene abbandonato, le prossime letture usano un nuovo worker
+                _logger.error(f"Camera {self._camera_id} read timed out")
+                self._reader.shutdown(wait=False)
+                self._reader = self._new_reader()
+                self._count("read_timeouts")
+                # la lettura appesa potrebbe ancora scrivere nel buffer: non torna nel pool
+                frame.data = None
+        if result:
+            if image is not frame.data:
+                # risoluzione diversa da quella dei buffer: OpenCV ha riallocato
+                self._pool.resize(image.shape)
+                frame.data = image
+            # con il processo di acquisizione conta l'istante dello scatto, non della copia
+            frame.captured_at = getattr(camera, "last_timestamp", 0) or time.monotonic()
+            self._set_last_frame(frame.retain())
+            return frame
+        frame.release()
+        if camera is not None:
+            self._count("read_failures")
+            self._reopen_async(reconnect=True)
+        last = self._last_frame
+        if last is not None and time.monotonic() - last.captured_at <= self._fallback_age:
+            _logger.warning("Camera read failed, using last good frame")
+            self._count("fallback_frames")
+            return last.retain()
+        raise CannotTakePictureError("Can't take photo")
+
+    def _read_at(self, deadline: float) -> Frame:
+        """Fotogramma acquisito più vicino a `deadline`; va rilasciato con `release()`.
+
+        Le letture iniziano `shutter.lead` secondi prima e si fermano al primo
+        fotogramma successivo alla scadenza, tenendo il più vicino dei due.
+        """
+        if not self.shutter.wait(deadline - self.shutter.lead):
+            raise CaptureCancelledError("Capture cancelled")
+        best: Frame | None = None
+        while True:
+            if self.shutter.cancelled:
+                if best:
+                    best.release()
+                raise CaptureCancelledError("Capture cancelled")
+            try:
+                frame = self._read()
+            except CameraError:
+                if best is None:
+                    raise
+                break
+            if frame is best:
+                # lettura fallita, è tornato l'ultimo fotogramma valido
+                frame.release()
+                break
+            if best is not None and abs(frame.captured_at - deadline) > abs(best.captured_at - deadline):
+                frame.release()
+                break
+            if best:
+                best.release()
+            best = frame
+            if frame.captured_at >= deadline:
+                break
+        return best
+
+    def _read_around(self, deadline: float) -> list[Frame]:
+        """Ultimi fotogrammi prima di `deadline` (al più metà raffica) e il primo dopo.
+
+        Le letture iniziano `shutter.lead` secondi prima; i fotogrammi che escono
+        dall'anello tornano subito al pool.
+        """
+        if not self.shutter.wait(deadline - self.shutter.lead):
+            raise CaptureCancelledError("Capture cancelled")
+        ring: deque[Frame] = deque()
+        try:
+            while True:
+                if self.shutter.cancelled:
+                    raise CaptureCancelledError("Capture cancelled")
+                try:
+                    frame = self._read()
+                except CameraError:
+                    if not ring:
+                        raise
+                    break
+                if ring and frame is ring[-1]:
+                    # lettura fallita, è tornato l'ultimo fotogramma valido
+                    frame.release()
+                    break
+                ring.append(frame)
+                if frame.captured_at >= deadline:
+                    break
+                if len(ring) > self._burst // 2:
+                    ring.popleft().release()
+        except BaseException:
+            for frame in ring:
+                frame.release()
+            raise
+        return list(ring)
+
+    def _read_burst(self, at: float | None = None) -> tuple[Frame, list[Frame]]:
+        """Raffica della posa; con `at` è centrata sulla scadenza.
+
+        I punteggi vengono calcolati mentre si leggono i fotogrammi successivi.
+        """
+        frames, scores = [], []
+        try:
+            if at is not None:
+                for frame in self._read_around(at):
+                    frames.append(frame)
+                    scores.append(self._scorer.submit(frame.data))
+            while len(frames) < self._burst:
+                frame = self._read()
+                frames.append(frame)
+                scores.append(self._scorer.submit(frame.data))
+        except CameraError:
+            for frame in frames:
+                frame.release()
+            raise
+        return frames[self._scorer.best(scores)], frames
+
+    def _record_clip(self, frames: list[Frame]) -> None:
+        for frame in frames:
+            self._clip.append(self._clip_frame(frame.data))
+
+    def _record_clip_tail(self, clip: list[Any]) -> None:
+        for _ in range(self._clip_frames_after):
+            try:
+                frame = self._read()
+            except CameraError:
+                # l'animazione resta solo più corta
+                return
+            clip.append(self._clip_frame(frame.data))
+            frame.release()
+
+    def _wait_clip_tail(self) -> None:
+        tail, self._clip_tail = self._clip_tail, None
+        if tail is not None:
+            tail.result()
+
+    def _clip_frame(self, image: Any) -> Any:
+        h, w = image.shape[:2]
+        scale = min(1, self._clip_width / w)
+        size = (int(w * scale) // 2 * 2, int(h * scale) // 2 * 2)
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    def clear(self) -> None:
+        """Scarta foto e fotogrammi rimasti da una sessione interrotta."""
+        while (frame := self.pop_pic(warn=False)) is not None:
+            frame.release()
+        self._clip = []
+
+    def pop_clip(self) -> list[Any]:
+        """Fotogrammi a bassa risoluzione registrati dall'ultima chiamata."""
+        self._wait_clip_tail()
+        clip, self._clip = self._clip, []
+        return clip
+
+    def take_pic(self, at: float | None = None) -> Frame:
+        """Scatta e accoda una foto; il fotogramma restituito appartiene alla coda.
+
+        Con `at` (orologio monotono, di norma `shutter.deadline`) il thread
+        chiamante attende la scadenza e usa il fotogramma più vicino.
+        """
+        if not self.wait_ready(_config.get("power.resume_timeout_sec", 10)):
             raise CameraNotReadyError(f"Camera {self._camera_id} not ready")
-        result, image = self._camera.read()
-        if not result:
-            raise CannotTakePictureError("Can't take photo")
-        self._enqueue_image(cv2_to_PIL(image))
+        # la coda della clip precedente precede i fotogrammi di questo scatto
+        self._wait_clip_tail()
+        if self._scorer:
+            image, frames = self._read_burst(at)
+        else:
+            image = self._read_at(at) if at is not None else self._read()
+            frames = [image]
+        try:
+            if self._record:
+                self._record_clip(frames)
+            self._enqueue_image(image)
+        except BaseException:
+            for frame in frames:
+                frame.release()
+            raise
+        if at is not None:
+            # dopo la scelta della raffica: conta il fotogramma che finisce nel foglio
+            self.shutter.record(at, image.captured_at)
+        # un riferimento per lettura: con il fotogramma di riserva la stessa Frame
+        # può comparire più volte, e solo uno passa alla coda
+        frames.remove(image)
+        for frame in frames:
+            frame.release()
+        if self._record:
+            self._clip_tail = self._clip_reader.submit(self._record_clip_tail, self._clip)
         if self._pics_queue.qsize() == self._pics_queue.maxsize:
             _logger.info(
                 f"CameraManager pics queue reached full capacity [{self._pics_queue.maxsize}]. Process it to avoid errors"
             )
         return image
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self.shutter.cancel()
+        if self._scorer:
+            self._scorer.stop()
+        self._reader.shutdown(wait=False, cancel_futures=True)
+        self._clip_reader.shutdown(wait=False, cancel_futures=True)
+        self.clear()
+        self._set_last_frame(None)
+        with self._lock:
+            if self._camera:
+                self._camera.release()
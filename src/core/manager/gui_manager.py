@@ -1,14 +1,71 @@
-from functools import wraps
-from pathlib import Path
-import pygame as pg
+from __future__ import annotations
 
-from core.image_utils import compute_cover_scale_factor, scale_surface
+import asyncio
+from concurrent.futures import wait
+from functools import wraps
+import time
+from typing import Callable
+
+from core.assets import AssetRegistry
+from core.scene import (
+    BackgroundLayer,
+    FrameStats,
+    ImageLayer,
+    Layer,
+    OverlayLayer,
+    Scene,
+    SequenceLayer,
+    SurfaceLayer,
+    TextLayer,
+    flatten,
+)
 from core.config import _config
 from core.logger import _logger
+from core.startup import lazy_import
+
+pg = lazy_import("pygame")
 
 
 _Position = tuple[int, int]
 _Size = tuple[int, int]
+# x, y, larghezza, altezza come frazioni del display
+_Region = tuple[float, float, float, float]
+
+# schermate senza parti animate, renderizzate una volta sola
+_STATIC_SCREENS = ("init", "token", "button", "retry")
+# durata della scritta "foto n/N" e di "in posa" attorno alle cifre del conto alla rovescia
+_LABEL_SEC = 2
+_POSE_SEC = 1
+
+
+# viste aperte sul display condiviso: gli eventi di pygame sono globali e
+# vengono distribuiti a tutte
+_views: list[GuiManager] = []
+# combinazioni di tasti dell'operatore: valgono per tutto il display, non per una vista
+_hotkeys: dict[tuple[int, int], Callable[[], None]] = {}
+
+
+def _modifiers(mod: int) -> int:
+    # sinistro o destro è indifferente
+    return sum(m for m in (pg.KMOD_CTRL, pg.KMOD_SHIFT, pg.KMOD_ALT) if mod & m)
+
+
+def add_hotkey(combo: str, callback: Callable[[], None]) -> None:
+    """Registra una combinazione come "ctrl+shift+p"; `callback` gira sul thread della gui."""
+    *mods, key = combo.lower().split("+")
+    names = {"ctrl": pg.KMOD_CTRL, "shift": pg.KMOD_SHIFT, "alt": pg.KMOD_ALT}
+    _hotkeys[(pg.key.key_code(key), sum(names[m] for m in mods))] = callback
+
+
+def _dispatch_events() -> None:
+    for event in pg.event.get():
+        if event.type == pg.KEYDOWN:
+            hotkey = _hotkeys.get((event.key, _modifiers(event.mod)))
+            if hotkey:
+                hotkey()
+                continue
+        for view in _views:
+            view._on_event(event)
 
 
 def deferred_init(func):
@@ -23,11 +80,35 @@ def deferred_init(func):
 
 class GuiManager:
 
-    def __init__(self, name: str, fullscreen: bool = False, deferred: bool = False):
+    def __init__(
+        self,
+        name: str,
+        fullscreen: bool = False,
+        deferred: bool = False,
+        assets: AssetRegistry | None = None,
+        region: _Region = (0, 0, 1, 1),
+    ):
         self.name = name if name else _config.get("app.name")
         self.fullscreen = fullscreen
         self._deferred = deferred
         self._initialized = False
+        self._owns_assets = assets is None
+        self._assets = assets if assets else AssetRegistry()
+        self._region = region
+        fps: int = _config.get("gui.fps", 30)
+        self._frame_sec = 1 / fps
+        self._frame_stats = FrameStats(fps)
+        self._scene = Scene()
+        self._layers: dict[str, Layer] = {}
+        self._static: dict[str, pg.Surface] = {}
+        self._static_version = _config.version
+        self._static_shown: str | None = None
+        self._sequences: dict[int, list[tuple[pg.Surface, pg.Rect]]] = {}
+        self._transition_sec: float = _config.get("gui.animation.transition_ms", 250) / 1000
+        self._digit_min_scale: float = _config.get("gui.animation.digit_min_scale", 0.5)
+        self._digit_frames_count: int = _config.get("gui.animation.digit_frames", fps)
+        self._pressed: set[int] = set()
+        self._stop_requested = False
         if not deferred:
             self._set_up()
         else:
@@ -40,176 +121,328 @@ class GuiManager:
         if self._deferred:
             _logger.info("Initializing gui")
 
-        pg.init()
-        pg.mouse.set_visible(False)
+        self._clock = pg.time.Clock()
+        _views.append(self)
+        # il display è unico: la prima vista lo crea, le altre ne usano una regione
+        if pg.display.get_surface() is None:
+            pg.init()
+            pg.mouse.set_visible(False)
 
-        _logger.info("Display setup")
-        self._setup_display(self.fullscreen)
-        _logger.info("Loading gui images")
-        self._load_images()
+            _logger.info("Display setup")
+            self._setup_display(self.fullscreen)
 
-        pg.display.set_caption(f"{self.name}-{_config.get('app.version')}", self.name)
-        pg.display.set_icon(self._get_image("icon"))
+            pg.display.set_caption(f"{self.name}-{_config.get('app.version')}", self.name)
+            pg.display.set_icon(self._get_image("icon"))
+        self._screen = self._view_surface()
 
     def _setup_display(self, fullscreen: bool):
         if fullscreen:
             info = pg.display.Info()
             screen_size = (info.current_w, info.current_h)
-            self._screen = pg.display.set_mode(screen_size, pg.FULLSCREEN)
+            pg.display.set_mode(screen_size, pg.FULLSCREEN)
         else:
             base_size = _config.get("app.base_size", (800, 600))
-            self._screen = pg.display.set_mode(base_size)
+            pg.display.set_mode(base_size)
+
+    def _view_surface(self) -> pg.Surface:
+        display = pg.display.get_surface()
+        w, h = display.get_size()
+        x, y, rw, rh = self._region
+        rect = pg.Rect(int(x * w), int(y * h), int(rw * w), int(rh * h))
+        if rect == display.get_rect():
+            return display
+        return display.subsurface(rect.clip(display.get_rect()))
+
+    def _update(self, rects: list[pg.Rect]) -> None:
+        # le aree sono relative alla vista, il display vuole coordinate assolute
+        offset = self._screen.get_abs_offset()
+        pg.display.update([rect.move(offset) for rect in rects])
 
     def _get_win_size(self) -> _Size:
         return pg.display.get_window_size()
 
-    def _load_images(self) -> None:
-        for path in _config.get("paths.folders"):
-            folder = _config.get("paths.folders." + path)
-            files = _config.get("paths." + folder)
-            if not files:
-                continue
-            self._images: list[pg.Surface] = {
-                file: pg.image.load(Path(folder) / Path(file)).convert_alpha()
-                for file in files.values()
-            }
+    def preload_images(self) -> None:
+        """Decodifica in parallelo le immagini della gui indicate in configurazione."""
+        _logger.info("Loading gui images")
+        wait(self._assets.prefetch(_config.get("gui.assets.prefetch")))
 
     def _get_image(self, key: str) -> pg.Surface:
-        return self._images.get(_config.get_path(key))
-
-    def _flip(self) -> None:
-        pg.display.flip()
-
-    def _blit_text(self, text: str, h_ratio: float, pos: _Position = None) -> None:
-        h_ratio = min(1, max(0.02, h_ratio))
-        size: int = int(self._screen.get_size()[1] * h_ratio)
-        font = pg.font.Font(None, int(size))
-        text_surf = font.render(text, True, _config.get("gui.colors.text"))
-        text_pos = text_surf.get_rect()
-        if not pos:
-            text_pos.center = self._screen.get_rect().center
-        else:
-            text_pos.center = pos
-        self._screen.blit(text_surf, text_pos)
+        return self._assets.get(key)
 
-    def _blit_image(
-        self,
-        image: pg.Surface,
-        pos: _Position,
-        scale: float = 1,
-        cover: bool = False,
-        inverse: bool = False,
-    ) -> None:
-        img_size = image.get_size()
-        screen_size = self._screen.get_size()
-        if cover:
-            transform_fn = lambda x, inverse: 1 / x if inverse else x
-            scale *= transform_fn(
-                compute_cover_scale_factor(img_size, screen_size), inverse
+    def pump_events(self) -> None:
+        if self._initialized:
+            pg.event.pump()
+
+    def _handle_events(self) -> None:
+        _dispatch_events()
+
+    def _on_event(self, event: pg.event.Event) -> None:
+        if event.type == pg.QUIT or (
+            event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE
+        ):
+            self._stop_requested = True
+        elif event.type == pg.KEYDOWN:
+            self._pressed.add(event.key)
+        elif event.type in (pg.VIDEORESIZE, pg.WINDOWSIZECHANGED):
+            self._screen = self._view_surface()
+            self._invalidate_static()
+            self._scene.invalidate()
+            if self._static_shown:
+                self._scene = Scene(SurfaceLayer(self._static_screen(self._static_shown)))
+
+    def _present(self) -> None:
+        """Gestisce gli eventi e aggiorna sullo schermo solo le aree cambiate."""
+        self._handle_events()
+        rects = self._scene.draw(self._screen)
+        if rects:
+            self._update(rects)
+
+    def _set_scene(self, *layers: Layer) -> None:
+        self._static_shown = None
+        self._scene = Scene(*layers)
+        self._present()
+
+    def _cached_layer(self, key: str, factory: Callable[[], Layer]) -> Layer:
+        if key not in self._layers:
+            self._layers[key] = factory()
+        return self._layers[key]
+
+    def _background(self, opacity: float = 0) -> list[Layer]:
+        layers = [
+            self._cached_layer(
+                "background",
+                lambda: BackgroundLayer(
+                    _config.get("gui.colors.background"), self._get_image("background")
+                ),
             )
-        image, img_size = scale_surface(image, scale)
-        if pos is None:
-            pos = None, None
-        x = pos[0] if pos[0] is not None else (screen_size[0] - img_size[0]) // 2
-        y = pos[1] if pos[1] is not None else (screen_size[1] - img_size[1]) // 2
-        self._screen.blit(image, (x, y))
-
-    def _blit_overlay(self, opacity: float = 0.75) -> None:
-        overlay = pg.Surface(self._screen.get_size())
-        overlay.set_alpha(int(255 * opacity))
-        overlay.fill("black")
-        self._screen.blit(overlay, (0, 0))
-
-    def _default_background(self) -> None:
-        self._screen.fill(_config.get("gui.colors.background"))
-        self._blit_image(self._get_image("background"), None, cover=True)
-
-    def _default_bg_with_overlay(self, opacity: float = 0.75) -> None:
-        self._default_background()
-        self._blit_overlay(opacity)
-
-    def _wait(self, secs: int) -> None:
-        pg.event.pump()
-        pg.time.wait(int(secs * 1000))
-        pg.event.pump()
-
-    def _show_photo_count(self, nth: int, total: int) -> None:
-        self._default_bg_with_overlay()
-        self._blit_text(
-            f"{_config.get("gui.labels.photo_count", "")} {nth}/{total}",
-            1 / 4,
-        )
-        self._flip()
-
-    def _show_countdown(self, countdown: int) -> None:
-        for i in range(countdown, 0, -1):
-            self._default_bg_with_overlay()
-            self._blit_text(str(i), 1 / 1.75)
-            self._flip()
-            self._wait(1)
+        ]
+        if opacity:
+            layers.append(
+                self._cached_layer(f"overlay_{opacity}", lambda: OverlayLayer(opacity))
+            )
+        return layers
+
+    def _text(self, text: str, h_ratio: float, pos: _Position = None) -> TextLayer:
+        return TextLayer(text, h_ratio, _config.get("gui.colors.text"), pos)
+
+    async def _run_until(
+        self, deadline: float, on_frame: Callable[[float], None] | None = None
+    ) -> bool:
+        """Ciclo a frequenza fissa fino a `deadline`; False se è stata chiesta la chiusura.
+
+        `on_frame` riceve l'istante del fotogramma e aggiorna i livelli animati.
+        """
+        self._clock.tick()
+        while True:
+            frame_started = time.monotonic()
+            cpu_started = time.thread_time()
+            if on_frame:
+                on_frame(frame_started)
+            self._present()
+            cpu_ms = (time.thread_time() - cpu_started) * 1000
+            if self._stop_requested:
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            # il resto del periodo va agli altri task invece di bloccare con Clock.tick(fps)
+            next_frame = self._frame_sec - (time.monotonic() - frame_started)
+            await asyncio.sleep(max(0, min(remaining, next_frame)))
+            self._frame_stats.add(self._clock.tick(), cpu_ms)
+
+    async def wait(self, secs: float) -> bool:
+        return await self._run_until(time.monotonic() + secs)
+
+    async def _crossfade(self, *layers: Layer) -> bool:
+        """Dissolvenza dalla schermata attuale alla nuova, poi la imposta come scena."""
+        if self._transition_sec <= 0:
+            self._set_scene(*layers)
+            return not self._stop_requested
+        old = self._screen.copy()
+        new = flatten(list(layers), self._screen.get_size())
+        started = time.monotonic()
+
+        def blend(now: float) -> None:
+            new.set_alpha(int(255 * min(1, (now - started) / self._transition_sec)))
+            self._screen.blit(old, (0, 0))
+            self._screen.blit(new, (0, 0))
+            self._update([self._screen.get_rect()])
+
+        ok = await self._run_until(started + self._transition_sec, blend)
+        self._set_scene(*layers)
+        return ok
+
+    def _digit_frames(self, digit: int) -> list[tuple[pg.Surface, pg.Rect]]:
+        """Fotogrammi della cifra che si rimpicciolisce e svanisce, per questo schermo."""
+        if digit in self._sequences:
+            return self._sequences[digit]
+        size = self._screen.get_size()
+        text = self._text(str(digit), 1 / 1.75)
+        base = text.surface(size)
+        center = text.rect.center
+        count = max(1, int(self._digit_frames_count))
+        frames = []
+        for k in range(count):
+            t = k / count
+            scale = 1 - (1 - self._digit_min_scale) * t * t
+            w, h = base.get_size()
+            frame = pg.transform.smoothscale(base, (max(1, int(w * scale)), max(1, int(h * scale))))
+            # dissolvenza nell'ultimo terzo del secondo
+            frame.set_alpha(int(255 * min(1, 3 * (1 - t))))
+            frames.append((frame, frame.get_rect(center=center)))
+        self._sequences[digit] = frames
+        return frames
+
+    def frame_stats(self) -> dict[str, float]:
+        return self._frame_stats.summary()
+
+    @property
+    def stop_requested(self) -> bool:
+        return self._stop_requested
+
+    def _static_layers(self, name: str) -> list[Layer]:
+        match name:
+            case "init":
+                return [*self._background(), self._text(_config.get("gui.labels.init", ""), 1 / 4)]
+            case "token":
+                return [
+                    *self._background(0.3),
+                    self._text(_config.get("gui.labels.token", ""), 1 / 4.5),
+                ]
+            case "button":
+                y = self._screen.get_rect().centery
+                arrow = ImageLayer(self._get_image("arrow"), (None, y + y // 4), 0.3, True, True)
+                return [
+                    *self._background(0.75),
+                    arrow,
+                    self._text(_config.get("gui.labels.button", ""), 1 / 4.5),
+                ]
+            case "retry":
+                return [
+                    *self._background(0.75),
+                    self._text(_config.get("gui.labels.camera_retry", ""), 1 / 8),
+                ]
+        raise KeyError(name)
+
+    def _static_screen(self, name: str) -> pg.Surface:
+        if self._static_version != _config.version:
+            _logger.info("Config reloaded, rendering static screens again")
+            self._invalidate_static()
+        if name not in self._static:
+            started = time.perf_counter()
+            self._static[name] = flatten(self._static_layers(name), self._screen.get_size())
+            _logger.debug(
+                f"Screen {name} rendered in {(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+        return self._static[name]
+
+    def _invalidate_static(self) -> None:
+        self._static.clear()
+        self._sequences.clear()
+        for layer in self._layers.values():
+            layer.invalidate()
+        self._static_version = _config.version
+
+    def _show_static(self, name: str) -> None:
+        # una sola copia dell'intera schermata già pronta
+        self._set_scene(SurfaceLayer(self._static_screen(name)))
+        self._static_shown = name
+
+    def prerender_screens(self) -> None:
+        """Prepara schermate statiche e animazioni, da chiamare quando le immagini sono caricate."""
+        if not self._initialized:
+            return
+        for name in _STATIC_SCREENS:
+            self._static_screen(name)
+        for digit in range(1, _config.get("photo.countdown") + 1):
+            self._digit_frames(digit)
 
     def show_init_screen(self) -> None:
         if not self._initialized:
             return
-        self._default_background()
-        self._blit_text(_config.get("gui.labels.init", ""), 1 / 4)
-        self._flip()
+        self._show_static("init")
 
     @deferred_init
     def show_token_screen(self) -> None:
-        self._default_bg_with_overlay(0.3)
-        self._blit_text(_config.get("gui.labels.token", ""), 1 / 4.5)
-        self._flip()
+        self._show_static("token")
 
     @deferred_init
     def show_button_screen(self) -> None:
-        self._default_bg_with_overlay()
-        y = self._screen.get_rect().centery
-        self._blit_image(self._get_image("arrow"), (None, y + y // 4), 0.3, True, True)
-        self._blit_text(_config.get("gui.labels.button", ""), 1 / 4.5)
-        self._flip()
+        self._show_static("button")
+
+    @staticmethod
+    def countdown_duration() -> float:
+        """Secondi dall'inizio del conto alla rovescia allo scatto."""
+        return _LABEL_SEC + _config.get("photo.countdown") + _POSE_SEC
 
     @deferred_init
-    def show_countdown_screen(self, photo_count: int) -> None:
-        self._show_photo_count(photo_count, _config.get("photo.count"))
-        self._wait(2)
-        self._show_countdown(_config.get("photo.countdown"))
-        self._blit_text(str(photo_count), 1 / 3)
-        self._default_bg_with_overlay()
-        self._blit_text(_config.get("gui.labels.pose"), 1 / 4)
-        self._flip()
-        self._wait(1)
+    async def show_countdown_screen(self, photo_count: int, deadline: float | None = None) -> bool:
+        """Conteggio fino allo scatto a `deadline` (orologio monotono); False se è stata chiesta la chiusura.
+
+        Le cifre sono disegnate rispetto alla scadenza: né animazioni né ritardi
+        di disegno spostano lo scatto, che avviene sul thread della fotocamera.
+        """
+        self._frame_stats.reset()
+        if deadline is None:
+            deadline = time.monotonic() + self.countdown_duration()
+        countdown: int = _config.get("photo.countdown")
+        started = deadline - _POSE_SEC - countdown
+        label = f"{_config.get("gui.labels.photo_count", "")} {photo_count}/{_config.get("photo.count")}"
+        if not await self._crossfade(*self._background(0.75), self._text(label, 1 / 4)):
+            return False
+        if not await self._run_until(started):
+            return False
+        digit = SequenceLayer(self._digit_frames(countdown))
+        self._set_scene(*self._background(0.75), digit)
+        for i in range(countdown, 0, -1):
+            digit_started = started + countdown - i
+            digit.set_frames(self._digit_frames(i))
+            ok = await self._run_until(
+                digit_started + 1, lambda now: digit.set_progress(now - digit_started)
+            )
+            if not ok:
+                return False
+        self._set_scene(
+            *self._background(0.75), self._text(_config.get("gui.labels.pose"), 1 / 4)
+        )
+        ok = await self._run_until(deadline)
+        late_ms = (time.monotonic() - deadline) * 1000
+        _logger.debug(f"Countdown ended {late_ms:.1f} ms after its deadline, frame stats: {self.frame_stats()}")
+        return ok
 
     @deferred_init
-    def show_print_preview(self, image: pg.Surface) -> None:
-        self._default_bg_with_overlay()
-        self._blit_image(image, None, 0.5, True)
+    def show_retry_screen(self) -> None:
+        self._show_static("retry")
+
+    @deferred_init
+    async def show_print_preview(self, image: pg.Surface) -> bool:
         x, y = self._screen.get_size()
-        self._blit_text(
-            _config.get("gui.labels.print_preview"),
-            1 / 8,
-            (x // 2, y - y // 9),
+        ok = await self._crossfade(
+            *self._background(0.75),
+            ImageLayer(image, None, 0.5, True),
+            self._text(_config.get("gui.labels.print_preview"), 1 / 8, (x // 2, y - y // 9)),
         )
-        self._flip()
-        self._wait(5)
+        return ok and await self.wait(5 - self._transition_sec)
 
     @deferred_init
     def is_pressed(self, key: int) -> bool:
-        for event in pg.event.get():
-            if event.type == pg.KEYDOWN and event.key == key:
-                return True
+        self._handle_events()
+        if key in self._pressed:
+            self._pressed.discard(key)
+            return True
         return False
 
     @deferred_init
     def request_to_stop(self) -> bool:
-        for event in pg.event.get():
-            if event.type == pg.QUIT or (
-                event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE
-            ):
-                return True
-        return False
+        self._handle_events()
+        return self._stop_requested
 
     def stop(self) -> None:
+        _logger.info(f"Gui frame stats: {self.frame_stats()}")
+        if self._owns_assets:
+            self._assets.stop()
         if not self._initialized:
             return
-        pg.quit()
+        _views.remove(self)
+        if not _views:
+            pg.quit()
@@ -1,6 +1,7 @@
 from enum import Enum, StrEnum
 from pathlib import Path
 import platform
+import subprocess
 import asyncio
 
 # import cups
@@ -47,7 +48,35 @@ class PrinterJobStates(Enum):
 class PrinterManager:
 
     def __init__(self):
-        pass
+        self._name = self._get_default_printer_name()
+        _logger.debug(f"Default printer: {self._name}")
+
+    def _get_windows_printer_name(self) -> str:
+        try:
+            import win32print
+
+            return win32print.GetDefaultPrinter()
+        except ImportError:
+            return "NONE"
+
+    def _get_linux_printer_name(self) -> str:
+        try:
+            result = subprocess.run(
+                ["lpstat", "-d"], capture_output=True, text=True, timeout=5
+            )
+        except (FileNotFoundError, subprocess.TimeoutExpired):
+            return "NONE"
+        # output: "system default destination: <nome>"
+        _, sep, name = result.stdout.partition(":")
+        return name.strip() if sep and name.strip() else "NONE"
+
+    def _get_default_printer_name(self) -> str:
+        os_name = platform.system()
+        match os_name:
+            case System.WINDOWS:
+                return self._get_windows_printer_name()
+            case System.LINUX:
+                return self._get_linux_printer_name()
 
     def get_sheet_format_size(self, format: SheetFormat | str) -> _Size:
         if type(format) == str:
@@ -95,7 +124,7 @@ class PrinterManager:
         self._start_printer_job_win(filename)
         # aspetta il thread in corso (stampa)
 
-    async def _print_linux(self) -> None:
+    async def _print_linux(self, filename: Path) -> None:
         pass
 
     async def send_print_request(self, filename: Path) -> bool:
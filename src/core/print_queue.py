@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+
+from core.catalog import PhotoCatalog
+from core.config import _config
+from core.journal import SessionJournal
+from core.logger import _logger
+from core.manager.printer_manager import PrinterJobStates, PrinterManager
+
+
+class PrintQueue:
+    """Coda di stampa condivisa: i fogli vengono stampati uno alla volta, in ordine di arrivo.
+
+    Al massimo `max_pending` fogli possono essere in coda; oltre, `submit` ed
+    `enqueue` attendono che si liberi un posto.
+    """
+
+    def __init__(
+        self,
+        printer: PrinterManager,
+        catalog: PhotoCatalog,
+        journal: SessionJournal | None = None,
+        max_pending: int = _config.get("usb.printer.max_queue", 10),
+    ) -> None:
+        self._printer = printer
+        self._catalog = catalog
+        self._journal = journal
+        self._slots = asyncio.Semaphore(max_pending)
+        self._printing = asyncio.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def enqueue(self, session_id: str, sheet: Path) -> asyncio.Task:
+        """Attende un posto libero in coda e restituisce il task della stampa."""
+        await self._slots.acquire()
+        return asyncio.create_task(self._print(session_id, sheet))
+
+    async def submit(self, session_id: str, sheet: Path) -> None:
+        """Accoda il foglio e ritorna quando la stampa è terminata."""
+        await (await self.enqueue(session_id, sheet))
+
+    async def _print(self, session_id: str, sheet: Path) -> None:
+        self._pending += 1
+        try:
+            print_id = self._catalog.add_print_job(
+                session_id, PrinterJobStates.PENDING.name
+            )
+            if self._journal:
+                self._journal.print_job(session_id, print_id)
+            try:
+                async with self._printing:
+                    self._catalog.update_print_job(
+                        print_id, PrinterJobStates.PROCESSING.name
+                    )
+                    await self._printer.send_print_request(sheet)
+            except Exception:
+                self._catalog.update_print_job(print_id, PrinterJobStates.ABORTED.name)
+                raise
+        finally:
+            self._pending -= 1
+            self._slots.release()
+        self._catalog.update_print_job(print_id, PrinterJobStates.COMPLETED.name)
+        _logger.debug(f"Printed {sheet} ({self._pending} sheets still queued)")
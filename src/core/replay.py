@@ -0,0 +1,412 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from typing import Any
+
+from core.catalog import PhotoCatalog, SessionStatus
+from core.config import _config
+from core.logger import _logger
+from core.manager.board_manager import BoardManager, Module, PinState
+from core.manager.printer_manager import PrinterManager
+from core.startup import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+pg = lazy_import("pygame")
+
+_IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+class SyntheticCapture:
+    """Sostituto di `cv2.VideoCapture` per il replay.
+
+    I fotogrammi arrivano da un video o da una cartella di immagini registrate
+    (ripetuti in ciclo) oppure, senza sorgente, da un'immagine sintetica con un
+    soggetto in movimento; la cadenza è quella di una fotocamera a `fps`.
+    """
+
+    def __init__(
+        self,
+        camera_id: int,
+        source: str = _config.get("replay.source", ""),
+        size: list[int] = _config.get("replay.frame_size", [1280, 720]),
+        fps: float = _config.get("replay.fps", 30),
+    ) -> None:
+        self._period = 1 / fps
+        self._next = time.monotonic()
+        self._video = None
+        self._images: list[Any] = []
+        self._tick = camera_id * 97
+        path = Path(source) if source else None
+        if path and path.is_dir():
+            files = sorted(p for p in path.iterdir() if p.suffix.lower() in _IMAGE_SUFFIXES)
+            self._images = [image for p in files if (image := cv2.imread(str(p))) is not None]
+        elif path:
+            self._video = cv2.VideoCapture(str(path))
+        if self._images:
+            self._shape = self._images[0].shape
+        elif self._video is not None and self._video.isOpened():
+            self._shape = (
+                int(self._video.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                int(self._video.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                3,
+            )
+        else:
+            if path:
+                _logger.warning(f"Replay source {path} not readable, using synthetic frames")
+            self._video = None
+            self._shape = (size[1], size[0], 3)
+            # gradiente orizzontale e verticale, il "soggetto" si muove sopra
+            x = np.linspace(0, 255, size[0], dtype=np.float32)
+            y = np.linspace(0, 255, size[1], dtype=np.float32)[:, None]
+            self._base = np.empty(self._shape, np.uint8)
+            self._base[..., 0] = x
+            self._base[..., 1] = y
+            self._base[..., 2] = 96
+
+    def isOpened(self) -> bool:
+        return True
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self._shape[1]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self._shape[0]
+        return 0
+
+    def _next_frame(self, image: Any) -> Any:
+        self._tick += 1
+        if self._images:
+            source = self._images[self._tick % len(self._images)]
+            if source.shape != image.shape:
+                return source.copy()
+            np.copyto(image, source)
+            return image
+        if self._video is not None:
+            result, frame = self._video.read(image)
+            if not result:
+                # fine del video: si ricomincia
+                self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                result, frame = self._video.read(image)
+            return frame if result else None
+        np.copyto(image, self._base)
+        h, w = self._shape[:2]
+        cx = int(w / 2 + w / 4 * np.sin(self._tick / 40))
+        cv2.circle(image, (cx, h // 2), h // 6, (170, 190, 230), -1)
+        return image
+
+    def read(self, image: Any = None) -> tuple[bool, Any]:
+        now = time.monotonic()
+        if now < self._next:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + self._period
+        if image is None or image.shape != self._shape:
+            image = np.empty(self._shape, np.uint8)
+        frame = self._next_frame(image)
+        return frame is not None, frame
+
+    def release(self) -> None:
+        if self._video is not None:
+            self._video.release()
+
+
+class ReplayDriver:
+    """Genera gli arrivi delle sessioni: `sessions` in totale, a intervalli fissi o casuali.
+
+    Gli arrivi vengono presi dalla prima postazione libera, quindi con più
+    postazioni le sessioni si sovrappongono.
+    """
+
+    def __init__(
+        self,
+        sessions: int = _config.get("replay.sessions", 100),
+        interval_sec: float = _config.get("replay.interval_sec", 0),
+        arrival: str = _config.get("replay.arrival", "fixed"),
+        seed: int = _config.get("replay.seed", 0),
+    ) -> None:
+        self.sessions = sessions
+        self._interval = interval_sec
+        self._poisson = arrival == "poisson"
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._started = 0
+        self._next_arrival = time.monotonic()
+        self.arrivals: list[float] = []
+
+    @property
+    def started(self) -> int:
+        return self._started
+
+    def take_arrival(self) -> bool:
+        """Vero se una nuova sessione deve partire adesso."""
+        with self._lock:
+            now = time.monotonic()
+            if self._started >= self.sessions or now < self._next_arrival:
+                return False
+            self._started += 1
+            self.arrivals.append(time.time())
+            gap = self._interval
+            if self._poisson and gap > 0:
+                gap = self._random.expovariate(1 / gap)
+            self._next_arrival = max(now, self._next_arrival) + gap
+            return True
+
+
+class ReplayBoard(BoardManager):
+    """Scheda simulata: il gettone arriva dal driver, il pulsante viene premuto appena richiesto."""
+
+    def __init__(self, modules: tuple[Module], driver: ReplayDriver) -> None:
+        super().__init__(modules)
+        self._driver = driver
+        self._by_pin = {module.pin: name for name, module in self.modules.items()}
+
+    def get_pin_state(self, name: int, expected: PinState = PinState.LOW) -> bool:
+        module = self._by_pin.get(name)
+        if module == "microswitch":
+            return self._driver.take_arrival()
+        return module == "button"
+
+
+class ReplayPrinter(PrinterManager):
+    """Stampante simulata: i fogli vengono contati ma non arrivano alla stampante vera."""
+
+    def __init__(self) -> None:
+        self._name = "replay"
+        self.printed = 0
+
+    async def send_print_request(self, filename: Path) -> bool:
+        self.printed += 1
+        _logger.debug(f"Replay: {filename} not printed")
+        return True
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Windows
+        return -1
+    # picco, non valore corrente: in KiB (in byte su macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _open_fds() -> int:
+    for folder in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(folder))
+        except OSError:
+            continue
+    return -1
+
+
+def _trend(points: list[tuple[float, float]], tolerance: float) -> dict[str, Any]:
+    """Pendenza ai minimi quadrati (unità/ora) e crescita tra il primo e l'ultimo terzo."""
+    if len(points) < 6:
+        return {"samples": len(points), "flagged": False}
+    x, y = zip(*points)
+    slope = statistics.linear_regression(x, y).slope if len(set(x)) > 1 else 0.0
+    third = len(y) // 3
+    first, last = statistics.fmean(y[:third]), statistics.fmean(y[-third:])
+    growth = (last - first) / first if first else 0.0
+    return {
+        "samples": len(points),
+        "first": round(first, 3),
+        "last": round(last, 3),
+        "slope_per_hour": round(slope * 3600, 3),
+        "growth": round(growth, 3),
+        "flagged": slope > 0 and growth > tolerance,
+    }
+
+
+class ResourceMonitor:
+    """Campiona RSS, descrittori aperti e memoria tracciata durante il replay.
+
+    Alla fine confronta uno snapshot di `tracemalloc` preso dopo il riscaldamento
+    con quello finale: le righe che allocano sempre di più sono i sospetti leak.
+    """
+
+    def __init__(
+        self,
+        interval_sec: float = _config.get("replay.sample_sec", 5),
+        warmup_sessions: int = _config.get("replay.warmup_sessions", 3),
+        top: int = _config.get("replay.top_allocations", 15),
+        frames: int = _config.get("replay.traceback_frames", 1),
+    ) -> None:
+        self._interval = interval_sec
+        self._warmup = warmup_sessions
+        self._top = top
+        self._frames = frames
+        self._started = time.monotonic()
+        self._baseline: tracemalloc.Snapshot | None = None
+        self.warm_at = 0.0
+        self.samples: list[dict[str, float]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="ReplayMonitor", daemon=True)
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._frames)
+        self._started = time.monotonic()
+        self._thread.start()
+
+    def sample(self) -> dict[str, float]:
+        traced, _ = tracemalloc.get_traced_memory()
+        sample = {
+            "t": round(time.monotonic() - self._started, 3),
+            "rss_mb": round(max(0, _rss_bytes()) / 2**20, 2),
+            "fds": _open_fds(),
+            "traced_mb": round(traced / 2**20, 2),
+        }
+        self.samples.append(sample)
+        return sample
+
+    def session_done(self, completed: int) -> None:
+        if self._baseline is None and completed >= self._warmup:
+            self._baseline = tracemalloc.take_snapshot()
+            self.warm_at = time.monotonic() - self._started
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self._interval):
+            self.sample()
+
+    def top_allocations(self) -> list[str]:
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        if self._baseline is None:
+            stats = snapshot.statistics("lineno")
+        else:
+            stats = snapshot.compare_to(self._baseline, "lineno")
+        return [str(stat) for stat in stats[: self._top]]
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+class ReplayHarness:
+    """Fa passare le sessioni del driver nella pipeline reale e ne registra l'andamento.
+
+    Controlla il catalogo: ogni sessione conclusa fornisce latenza e tempi
+    delle fasi; quando tutte sono concluse chiede la chiusura dell'applicazione
+    e scrive il report.
+    """
+
+    def __init__(
+        self,
+        catalog: PhotoCatalog,
+        driver: ReplayDriver,
+        monitor: ResourceMonitor | None = None,
+        tolerance: float = _config.get("replay.trend_tolerance", 0.1),
+        report_dir: Path = Path(_config.get("paths.folders.logs", "logs")),
+    ) -> None:
+        self._catalog = catalog
+        self._driver = driver
+        self._monitor = monitor or ResourceMonitor()
+        self._tolerance = tolerance
+        self._report_dir = report_dir
+        self._started_at = time.time()
+        self._sessions: list[dict[str, Any]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="ReplayHarness", daemon=True)
+
+    def start(self) -> None:
+        self._started_at = time.time()
+        self._monitor.start()
+        self._thread.start()
+        _logger.info(f"Replay started: {self._driver.sessions} sessions")
+
+    def _finished(self) -> list[dict[str, Any]]:
+        self._catalog.flush(timeout=5)
+        return [
+            session
+            for session in self._catalog.sessions_between(self._started_at, time.time() + 1)
+            if session["status"] != SessionStatus.STARTED
+        ]
+
+    def _loop(self) -> None:
+        done = 0
+        while not self._stop.wait(1):
+            finished = self._finished()
+            if len(finished) == done:
+                continue
+            done = len(finished)
+            self._monitor.session_done(done)
+            _logger.info(f"Replay: {done}/{self._driver.sessions} sessions done")
+            if done >= self._driver.sessions:
+                self._sessions = finished
+                # tutte le postazioni escono dal ciclo come con ESC
+                pg.event.post(pg.event.Event(pg.QUIT))
+                return
+
+    def report(self) -> dict[str, Any]:
+        sessions = self._sessions or self._finished()
+        latencies, phases = [], {}
+        for session in sessions:
+            if session["ended_at"] is None:
+                continue
+            latency = session["ended_at"] - session["started_at"]
+            latencies.append((session["ended_at"] - self._started_at, latency))
+            for phase, secs in json.loads(session["timings"] or "{}").items():
+                phases.setdefault(phase, []).append((session["ended_at"] - self._started_at, secs))
+        samples = self._monitor.samples
+        # il riscaldamento (cache, pool, font) non conta come crescita
+        warm = [s for s in samples if s["t"] >= self._monitor.warm_at]
+        trends = {
+            key: _trend([(s["t"], s[key]) for s in warm], self._tolerance)
+            for key in ("rss_mb", "fds", "traced_mb")
+        }
+        trends["latency_sec"] = _trend(latencies, self._tolerance)
+        for phase, points in phases.items():
+            trends[f"{phase}_sec"] = _trend(points, self._tolerance)
+        values = sorted(latency for _, latency in latencies)
+        return {
+            "sessions": len(sessions),
+            "failed": sum(1 for s in sessions if s["status"] == SessionStatus.FAILED),
+            "duration_sec": round(time.time() - self._started_at, 1),
+            "latency_sec": {
+                "p50": round(statistics.median(values), 3) if values else None,
+                "p95": round(values[int(len(values) * 0.95)], 3) if values else None,
+                "max": round(values[-1], 3) if values else None,
+            },
+            "trends": trends,
+            "top_allocations": self._monitor.top_allocations(),
+            "samples": samples,
+        }
+
+    def stop(self) -> dict[str, Any]:
+        self._stop.set()
+        self._thread.join()
+        self._monitor.stop()
+        report = self.report()
+        for key, trend in report["trends"].items():
+            if trend["flagged"]:
+                _logger.warning(
+                    f"Replay: {key} is growing ({trend['first']} -> {trend['last']}, "
+                    f"{trend['slope_per_hour']}/h)"
+                )
+        _logger.info(
+            f"Replay finished: {report['sessions']} sessions, {report['failed']} failed, "
+            f"latency {report['latency_sec']}"
+        )
+        for line in report["top_allocations"]:
+            _logger.debug(f"Replay allocation: {line}")
+        self._report_dir.mkdir(parents=True, exist_ok=True)
+        path = self._report_dir / f"replay_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        _logger.info(f"Replay report saved to {path}")
+        return report
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Future
+from pathlib import Path
+
+from core.catalog import PhotoCatalog, SessionStatus
+from core.logger import _logger
+from core.print_queue import PrintQueue
+
+_Sheet = tuple[str, Path]
+
+
+class Reprinter:
+    """Ristampa fogli già stampati, inviando alla coda il file salvato così com'è.
+
+    Nessuna decodifica né ricomposizione: il foglio nel catalogo è già pronto
+    per la stampa. Le richieste possono arrivare da qualsiasi thread (tasto
+    operatore, endpoint di amministrazione) e vengono eseguite sul loop asyncio
+    delle postazioni.
+    """
+
+    def __init__(self, catalog: PhotoCatalog, print_queue: PrintQueue) -> None:
+        self._catalog = catalog
+        self._queue = print_queue
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._running: set[Future] = set()
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def _printable(self, sessions: list[dict]) -> list[_Sheet]:
+        sheets = []
+        for session in sessions:
+            path = Path(session["sheet_path"]) if session["sheet_path"] else None
+            if session["status"] != SessionStatus.COMPLETED or path is None or not path.is_file():
+                # i fogli archiviati sono compressi, non stampabili direttamente
+                _logger.warning(f"Sheet of session {session['id']} not available for reprint")
+                continue
+            sheets.append((session["id"], path))
+        return sheets
+
+    def latest(self) -> list[_Sheet]:
+        return self._printable(self._catalog.sheets(1))
+
+    def sessions(self, session_ids: list[str]) -> list[_Sheet]:
+        sessions = []
+        for session_id in session_ids:
+            if (session := self._catalog.session(session_id)) is None:
+                _logger.warning(f"Unknown session {session_id}, not reprinted")
+                continue
+            sessions.append(session)
+        return self._printable(sessions)
+
+    def between(self, first_id: str, last_id: str) -> list[_Sheet]:
+        """Fogli delle sessioni da `first_id` a `last_id` incluse, in ordine di scatto."""
+        first, last = self._catalog.session(first_id), self._catalog.session(last_id)
+        if first is None or last is None:
+            _logger.warning(f"Unknown session range {first_id}..{last_id}")
+            return []
+        start, end = sorted((first["started_at"], last["started_at"]))
+        # l'estremo superiore è escluso dalla query
+        sessions = self._catalog.sessions_between(start, end)
+        sessions.append(last if last["started_at"] == end else first)
+        return self._printable([s for s in sessions if s["sheet_path"]])
+
+    async def print_sheets(self, sheets: list[_Sheet]) -> int:
+        """Accoda i fogli in ordine; con la coda piena attende un posto prima del successivo."""
+        jobs = []
+        for session_id, path in sheets:
+            _logger.info(f"Reprinting {path} (session {session_id})")
+            jobs.append(await self._queue.enqueue(session_id, path))
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        failed = [r for r in results if isinstance(r, BaseException)]
+        for error in failed:
+            _logger.error(f"Reprint failed: {error}")
+        return len(results) - len(failed)
+
+    def schedule(self, sheets: list[_Sheet]) -> Future | None:
+        """Avvia la ristampa dal thread chiamante senza attenderla."""
+        if not sheets or self._loop is None or self._loop.is_closed():
+            return None
+        future = asyncio.run_coroutine_threadsafe(self.print_sheets(sheets), self._loop)
+        self._running.add(future)
+        future.add_done_callback(self._running.discard)
+        return future
@@ -0,0 +1,278 @@
+import datetime
+import os
+from pathlib import Path
+import shutil
+import threading
+import time
+from typing import Iterator
+import zipfile
+
+from core.animation import ANIMATION_FORMATS
+from core.catalog import PhotoCatalog
+from core.config import _config
+from core.logger import _logger
+from core.storage import PhotoStorage
+from core.thumbnails import ThumbnailCache
+from core.utils import lower_thread_priority
+
+_CHUNK_SIZE = 256 * 1024
+_MB = 2**20
+
+
+class _Stopped(Exception):
+    """Interrompe il lavoro in corso alla chiusura dell'applicazione."""
+
+
+class RetentionManager:
+    """Mantiene le cartelle delle foto entro un budget di spazio su disco.
+
+    Lavora su un thread a bassa priorità solo mentre il photobooth è inattivo
+    e limita la velocità di I/O. Quando il budget è superato libera spazio in
+    quest'ordine: miniature, animazioni accanto ai fogli (solo i file con il
+    nome di un foglio e l'estensione di un'animazione), archiviazione dei
+    giorni più vecchi di `hot_days`. Gli archivi hanno un budget proprio: oltre quello
+    vengono eliminati i più vecchi.
+
+    Lo spazio libero minimo si misura sul disco: archiviare un giorno libera
+    solo la differenza tra originali e archivio se questo sta sullo stesso
+    volume, e se non basta vengono eliminati anche gli archivi più vecchi.
+    """
+
+    def __init__(
+        self,
+        storage: PhotoStorage,
+        archive_root: Path,
+        thumbnails: ThumbnailCache,
+        catalog: PhotoCatalog,
+        budget_mb: float = _config.get("storage.budget_mb", 8192),
+        archive_budget_mb: float = _config.get("storage.archive_budget_mb", 16384),
+        min_free_mb: float = _config.get("storage.min_free_mb", 512),
+        hot_days: int = _config.get("storage.hot_days", 7),
+        compression: int = _config.get("storage.archive_compression", 1),
+        interval_sec: float = _config.get("storage.check_interval_sec", 300),
+        io_rate_mb: float = _config.get("storage.io_rate_mb", 4),
+        niceness: int = _config.get("storage.niceness", 15),
+    ) -> None:
+        self._storage = storage
+        self._photos_root = storage.root
+        self._archive_root = Path(archive_root)
+        self._thumbnails = thumbnails
+        self._catalog = catalog
+        self._budget = int(budget_mb * _MB)
+        self._archive_budget = int(archive_budget_mb * _MB)
+        self._min_free = int(min_free_mb * _MB)
+        self._hot_days = hot_days
+        self._compression = compression
+        self._interval = interval_sec
+        self._io_rate = io_rate_mb * _MB
+        self._niceness = niceness
+        self._idle = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="Retention", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def set_idle(self, idle: bool) -> None:
+        """Il lavoro di pulizia procede solo mentre il photobooth è inattivo."""
+        if idle:
+            self._idle.set()
+        else:
+            self._idle.clear()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._idle.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        lower_thread_priority(self._niceness)
+        while not self._stopping.wait(self._interval):
+            try:
+                self.enforce()
+            except _Stopped:
+                return
+            except Exception as e:
+                # un errore non deve fermare il thread: si riprova al prossimo controllo
+                _logger.exception(f"Storage retention failed: {e}")
+
+    def _wait_idle(self) -> None:
+        self._idle.wait()
+        if self._stopping.is_set():
+            raise _Stopped()
+
+    def _throttle(self, nbytes: int) -> None:
+        if self._io_rate > 0:
+            time.sleep(nbytes / self._io_rate)
+        self._wait_idle()
+
+    # analisi
+
+    def _walk(self, root: Path) -> Iterator[os.DirEntry]:
+        if not root.is_dir():
+            return
+        stack = [root]
+        scanned = 0
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    scanned += 1
+                    if scanned % 256 == 0:
+                        self._throttle(0)
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+
+    def _usage(self) -> int:
+        # gli archivi hanno un budget separato
+        roots = (self._photos_root, self._thumbnails.root)
+        return sum(entry.stat().st_size for root in roots for entry in self._walk(root))
+
+    def _shortfall(self) -> int:
+        return self._min_free - shutil.disk_usage(self._photos_root).free
+
+    def _needed(self, usage: int) -> int:
+        return max(usage - self._budget, self._shortfall())
+
+    def _on_photos_volume(self, path: Path) -> bool:
+        return os.stat(path).st_dev == os.stat(self._photos_root).st_dev
+
+    def enforce(self) -> None:
+        self._wait_idle()
+        usage = self._usage()
+        needed = self._needed(usage)
+        if needed > 0:
+            _logger.info(
+                f"Photo storage over budget ({usage // _MB} MB used), freeing {needed // _MB} MB"
+            )
+            for step in (self._prune_thumbnails, self._prune_derived):
+                freed = step(needed)
+                usage -= freed
+                needed -= freed
+                if needed <= 0:
+                    break
+            else:
+                self._archive_days(usage - self._budget, self._shortfall())
+        self._prune_archives(self._shortfall())
+        if needed > 0 and (needed := self._needed(self._usage())) > 0:
+            _logger.warning(
+                f"Photo storage still over budget by {needed // _MB} MB: only the last {self._hot_days} days are left unarchived"
+            )
+
+    # passi di pulizia
+
+    def _delete_oldest(self, entries: list[os.DirEntry], needed: int) -> int:
+        freed = 0
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            if freed >= needed:
+                break
+            size = entry.stat().st_size
+            os.unlink(entry.path)
+            freed += size
+            self._throttle(0)
+        return freed
+
+    def _prune_thumbnails(self, needed: int) -> int:
+        freed = self._delete_oldest(list(self._walk(self._thumbnails.root)), needed)
+        _logger.info(f"Pruned {freed // 1024} KB of thumbnails")
+        return freed
+
+    def _prune_derived(self, needed: int) -> int:
+        derived = [
+            entry
+            for entry in self._walk(self._photos_root)
+            if self._storage.is_derived(entry.name, ANIMATION_FORMATS)
+        ]
+        freed = self._delete_oldest(derived, needed)
+        _logger.info(f"Pruned {freed // 1024} KB of derived files")
+        return freed
+
+    def _cold_days(self) -> list[tuple[datetime.date, Path]]:
+        limit = datetime.date.today() - datetime.timedelta(days=self._hot_days)
+        days = []
+        for shard in self._photos_root.glob("[0-9][0-9][0-9][0-9]/[0-9][0-9]/[0-9][0-9]"):
+            try:
+                day = datetime.date(*(int(part) for part in shard.parts[-3:]))
+            except ValueError:
+                continue
+            if day < limit and shard.is_dir():
+                days.append((day, shard))
+        return sorted(days)
+
+    def _archive_days(self, excess: int, shortfall: int) -> int:
+        """Archivia i giorni più vecchi finché `excess` byte non sono usciti dal budget
+        e `shortfall` byte non sono stati liberati sul disco."""
+        moved = freed = 0
+        for day, shard in self._cold_days():
+            if moved >= excess and freed >= shortfall:
+                break
+            original, archive = self._archive_day(day, shard)
+            moved += original
+            if archive and self._on_photos_volume(archive):
+                freed += original - archive.stat().st_size
+            else:
+                freed += original
+        return freed
+
+    def _prune_archives(self, shortfall: int) -> int:
+        archives = list(self._walk(self._archive_root))
+        excess = 0
+        if self._archive_budget > 0:
+            excess = sum(entry.stat().st_size for entry in archives) - self._archive_budget
+        if shortfall > 0 and archives and self._on_photos_volume(self._archive_root):
+            # il disco delle foto è quasi pieno: gli archivi più vecchi lasciano posto
+            excess = max(excess, shortfall)
+        if excess <= 0:
+            return 0
+        freed = self._delete_oldest(archives, excess)
+        _logger.warning(f"Deleted {freed // _MB} MB of the oldest archives to stay within limits")
+        return freed
+
+    def _archive_path(self, day: datetime.date) -> Path:
+        folder = self._archive_root / f"{day.year:04d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"{day.isoformat()}.zip"
+        count = 1
+        while path.exists():
+            count += 1
+            path = folder / f"{day.isoformat()}_{count}.zip"
+        return path
+
+    def _archive_day(self, day: datetime.date, shard: Path) -> tuple[int, Path | None]:
+        """Byte dei file archiviati e percorso dell'archivio; gli originali vengono
+        eliminati solo a archivio completo."""
+        files = sorted(self._walk(shard), key=lambda e: e.name)
+        if not files:
+            shard.rmdir()
+            return 0, None
+        archive = self._archive_path(day)
+        partial = archive.with_suffix(".zip.part")
+        original = 0
+        try:
+            # livello basso: i JPEG guadagnano poco, i PNG dei fogli grandi molto
+            with zipfile.ZipFile(
+                partial, "w", zipfile.ZIP_DEFLATED, compresslevel=self._compression
+            ) as zf:
+                for entry in files:
+                    original += entry.stat().st_size
+                    arcname = Path(entry.path).relative_to(shard).as_posix()
+                    with open(entry.path, "rb") as src, zf.open(arcname, "w") as dst:
+                        while chunk := src.read(_CHUNK_SIZE):
+                            dst.write(chunk)
+                            self._throttle(len(chunk))
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        os.replace(partial, archive)
+        for entry in files:
+            os.unlink(entry.path)
+        shutil.rmtree(shard, ignore_errors=True)
+        self._catalog.mark_archived(shard)
+        _logger.info(
+            f"Archived {len(files)} files of {day.isoformat()} into {archive} ({original // 1024} KB)"
+        )
+        return original, archive
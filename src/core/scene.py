@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import functools
+from typing import Any
+
+from core.image_utils import compute_cover_scale_factor, scale_surface
+from core.startup import lazy_import
+
+pg = lazy_import("pygame")
+
+_Position = tuple[int | None, int | None]
+_Size = tuple[int, int]
+
+
+@functools.lru_cache(maxsize=16)
+def _font(size: int) -> pg.font.Font:
+    return pg.font.Font(None, size)
+
+
+class Layer:
+    """Elemento di una schermata con la sua superficie già disegnata.
+
+    La superficie viene ridisegnata solo dopo `invalidate()`; la scena
+    aggiorna sullo schermo soltanto le aree dei livelli modificati.
+    """
+
+    def __init__(self) -> None:
+        self.rect = pg.Rect(0, 0, 0, 0)
+        self._surface: pg.Surface | None = None
+        self.dirty = True
+
+    def invalidate(self) -> None:
+        self._surface = None
+        self.dirty = True
+
+    def _render(self, screen_size: _Size) -> tuple[pg.Surface, pg.Rect]:
+        raise NotImplementedError()
+
+    def surface(self, screen_size: _Size) -> pg.Surface:
+        if self._surface is None:
+            self._surface, self.rect = self._render(screen_size)
+        return self._surface
+
+
+class BackgroundLayer(Layer):
+    """Colore di sfondo con un'immagine che copre tutto lo schermo."""
+
+    def __init__(self, color: Any, image: pg.Surface) -> None:
+        super().__init__()
+        self._color = color
+        self._image = image
+
+    def _render(self, screen_size: _Size) -> tuple[pg.Surface, pg.Rect]:
+        surface = pg.Surface(screen_size).convert()
+        surface.fill(self._color)
+        image = ImageLayer(self._image, None, cover=True)
+        surface.blit(image.surface(screen_size), image.rect)
+        return surface, surface.get_rect()
+
+
+class OverlayLayer(Layer):
+    def __init__(self, opacity: float, color: Any = "black") -> None:
+        super().__init__()
+        self._opacity = opacity
+        self._color = color
+
+    def _render(self, screen_size: _Size) -> tuple[pg.Surface, pg.Rect]:
+        surface = pg.Surface(screen_size).convert()
+        surface.fill(self._color)
+        surface.set_alpha(int(255 * self._opacity))
+        return surface, surface.get_rect()
+
+
+class ImageLayer(Layer):
+    def __init__(
+        self,
+        image: pg.Surface,
+        pos: _Position | None,
+        scale: float = 1,
+        cover: bool = False,
+        inverse: bool = False,
+    ) -> None:
+        super().__init__()
+        self._image = image
+        self._pos = pos
+        self._scale = scale
+        self._cover = cover
+        self._inverse = inverse
+
+    def _render(self, screen_size: _Size) -> tuple[pg.Surface, pg.Rect]:
+        scale = self._scale
+        if self._cover:
+            factor = compute_cover_scale_factor(self._image.get_size(), screen_size)
+            scale *= 1 / factor if self._inverse else factor
+        image, img_size = scale_surface(self._image, scale)
+        pos = self._pos if self._pos is not None else (None, None)
+        x = pos[0] if pos[0] is not None else (screen_size[0] - img_size[0]) // 2
+        y = pos[1] if pos[1] is not None else (screen_size[1] - img_size[1]) // 2
+        return image, pg.Rect((x, y), img_size)
+
+
+class TextLayer(Layer):
+    """Testo centrato in `pos` (o nello schermo), alto `h_ratio` dello schermo."""
+
+    def __init__(
+        self, text: str, h_ratio: float, color: Any, pos: _Position | None = None
+    ) -> None:
+        super().__init__()
+        self._text = text
+        self._h_ratio = min(1, max(0.02, h_ratio))
+        self._color = color
+        self._pos = pos
+
+    def set_text(self, text: str) -> None:
+        if text != self._text:
+            self._text = text
+            self.invalidate()
+
+    def _render(self, screen_size: _Size) -> tuple[pg.Surface, pg.Rect]:
+        font = _font(int(screen_size[1] * self._h_ratio))
+        surface = font.render(self._text, True, self._color)
+        rect = surface.get_rect()
+        rect.center = self._pos if self._pos else (screen_size[0] // 2, screen_size[1] // 2)
+        return surface, rect
+
+
+class SurfaceLayer(Layer):
+    """Superficie già pronta, ad esempio una schermata pre-renderizzata."""
+
+    def __init__(self, surface: pg.Surface, pos: tuple[int, int] = (0, 0)) -> None:
+        super().__init__()
+        self._source = surface
+        self._pos = pos
+
+    def _render(self, screen_size: _Size) -> tuple[pg.Surface, pg.Rect]:
+        return self._source, self._source.get_rect(topleft=self._pos)
+
+
+class SequenceLayer(Layer):
+    """Animazione da fotogrammi già pronti: cambiarne uno costa solo una copia."""
+
+    def __init__(self, frames: list[tuple[pg.Surface, pg.Rect]]) -> None:
+        super().__init__()
+        self._frames = frames
+        self._index = 0
+
+    def set_frames(self, frames: list[tuple[pg.Surface, pg.Rect]]) -> None:
+        self._frames = frames
+        self._index = 0
+        self.invalidate()
+
+    def set_progress(self, progress: float) -> None:
+        """Mostra il fotogramma corrispondente a `progress` (da 0 a 1)."""
+        index = min(len(self._frames) - 1, max(0, int(progress * len(self._frames))))
+        if index != self._index:
+            self._index = index
+            self.invalidate()
+
+    def _render(self, screen_size: _Size) -> tuple[pg.Surface, pg.Rect]:
+        return self._frames[self._index]
+
+
+def flatten(layers: list[Layer], screen_size: _Size) -> pg.Surface:
+    """Compone i livelli in un'unica superficie grande quanto lo schermo."""
+    surface = pg.Surface(screen_size).convert()
+    for layer in layers:
+        surface.blit(layer.surface(screen_size), layer.rect)
+    return surface
+
+
+class Scene:
+    """Schermata composta da livelli, disegnati dal basso verso l'alto."""
+
+    def __init__(self, *layers: Layer) -> None:
+        self.layers = list(layers)
+        self._full_redraw = True
+
+    def invalidate(self) -> None:
+        """Da chiamare quando cambia il display: tutti i livelli vanno ridisegnati."""
+        for layer in self.layers:
+            layer.invalidate()
+        self._full_redraw = True
+
+    def draw(self, screen: pg.Surface) -> list[pg.Rect]:
+        """Ridisegna le aree cambiate e le restituisce per `display.update`."""
+        size = screen.get_size()
+        if self._full_redraw:
+            self._full_redraw = False
+            for layer in self.layers:
+                screen.blit(layer.surface(size), layer.rect)
+                layer.dirty = False
+            return [screen.get_rect()]
+        rects = []
+        for layer in self.layers:
+            if layer.dirty:
+                # sia la vecchia che la nuova area del livello
+                old = layer.rect.copy()
+                layer.surface(size)
+                rects.extend({tuple(old): old, tuple(layer.rect): layer.rect.copy()}.values())
+                layer.dirty = False
+        rects = [rect for rect in rects if rect.width and rect.height]
+        for rect in rects:
+            screen.set_clip(rect)
+            for layer in self.layers:
+                if layer.rect.colliderect(rect):
+                    screen.blit(layer.surface(size), layer.rect)
+        screen.set_clip(None)
+        return rects
+
+
+class FrameStats:
+    """Tempo per fotogramma, fotogrammi persi e CPU usata dal ciclo della gui."""
+
+    def __init__(self, fps: int) -> None:
+        self._frame_ms = 1000 / fps
+        self.reset()
+
+    def reset(self) -> None:
+        self._frames = 0
+        self._dropped = 0
+        self._frame_total = 0.0
+        self._frame_max = 0.0
+        self._cpu_total = 0.0
+
+    def add(self, frame_ms: float, cpu_ms: float) -> None:
+        self._frames += 1
+        self._frame_total += frame_ms
+        self._frame_max = max(self._frame_max, frame_ms)
+        self._cpu_total += cpu_ms
+        # un fotogramma che dura più di 1.5 periodi ne ha saltato almeno uno
+        if frame_ms > self._frame_ms * 1.5:
+            self._dropped += int(frame_ms // self._frame_ms) - 1 or 1
+
+    def summary(self) -> dict[str, float]:
+        frames = max(1, self._frames)
+        return {
+            "frames": self._frames,
+            "dropped": self._dropped,
+            "frame_ms_avg": round(self._frame_total / frames, 2),
+            "frame_ms_max": round(self._frame_max, 2),
+            "cpu_ms_avg": round(self._cpu_total / frames, 2),
+        }
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from core.config import _config
+from core.logger import _logger
+
+
+class Shutter:
+    """Istante dello scatto su orologio monotono, condiviso da gui e fotocamera.
+
+    La scadenza viene fissata prima del conto alla rovescia: la gui la usa per
+    disegnare le cifre, il thread di acquisizione per scegliere il fotogramma.
+    Nessuno dei due aspetta l'altro, quindi i ritardi di disegno non spostano
+    lo scatto. Lo scarto tra scadenza e istante del fotogramma scelto viene
+    registrato come metrica.
+    """
+
+    def __init__(self, lead: float = _config.get("photo.shutter.lead_ms", 150) / 1000) -> None:
+        # anticipo con cui il thread di acquisizione inizia a leggere
+        self.lead = lead
+        self._deadline: float | None = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._offsets = {"count": 0, "last": 0.0, "total_abs": 0.0, "max_abs": 0.0}
+
+    @property
+    def deadline(self) -> float | None:
+        return self._deadline
+
+    def arm(self, delay: float) -> float:
+        """Fissa lo scatto fra `delay` secondi e restituisce la scadenza."""
+        self._cancelled.clear()
+        self._deadline = time.monotonic() + delay
+        return self._deadline
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def wait(self, until: float) -> bool:
+        """Blocca il thread chiamante fino a `until`; False se lo scatto è stato annullato."""
+        while (remaining := until - time.monotonic()) > 0:
+            if self._cancelled.wait(remaining):
+                return False
+        return not self._cancelled.is_set()
+
+    def record(self, deadline: float, captured_at: float) -> float:
+        """Registra lo scarto in ms del fotogramma scelto rispetto alla scadenza."""
+        offset = (captured_at - deadline) * 1000
+        with self._lock:
+            self._offsets["count"] += 1
+            self._offsets["last"] = offset
+            self._offsets["total_abs"] += abs(offset)
+            self._offsets["max_abs"] = max(self._offsets["max_abs"], abs(offset))
+        _logger.info(f"Shutter offset {offset:+.1f} ms")
+        return offset
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            count = self._offsets["count"]
+            return {
+                "shutter_shots": count,
+                "shutter_offset_ms_last": self._offsets["last"],
+                "shutter_offset_ms_mean_abs": self._offsets["total_abs"] / count if count else 0.0,
+                "shutter_offset_ms_max_abs": self._offsets["max_abs"],
+            }
@@ -0,0 +1,97 @@
+from contextlib import AbstractContextManager, contextmanager
+import importlib
+import sys
+import threading
+import time
+import types
+from typing import Iterator
+
+
+class StartupReport:
+    """Raccoglie i tempi di import e di inizializzazione dei sottosistemi."""
+
+    def __init__(self) -> None:
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._imports: dict[str, tuple[float, float, str]] = {}
+        self._phases: dict[str, tuple[float, float, str]] = {}
+        self._marks: dict[str, float] = {}
+
+    def _elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    @contextmanager
+    def _timed(self, target: dict, name: str) -> Iterator[None]:
+        start = self._elapsed()
+        try:
+            yield
+        finally:
+            duration = self._elapsed() - start
+            with self._lock:
+                target[name] = (start, duration, threading.current_thread().name)
+
+    def timed_import(self, name: str) -> AbstractContextManager[None]:
+        return self._timed(self._imports, name)
+
+    def phase(self, name: str) -> AbstractContextManager[None]:
+        return self._timed(self._phases, name)
+
+    def mark(self, name: str) -> bool:
+        """Registra un traguardo; restituisce True solo la prima volta."""
+        with self._lock:
+            if name in self._marks:
+                return False
+            self._marks[name] = self._elapsed()
+            return True
+
+    def render(self) -> str:
+        lines = ["Startup report (ms since core import)"]
+        sections = (("imports", self._imports), ("init", self._phases))
+        with self._lock:
+            for title, entries in sections:
+                lines.append(f"  {title}:")
+                for name, (start, duration, thread) in sorted(
+                    entries.items(), key=lambda e: e[1][0]
+                ):
+                    lines.append(
+                        f"    {name:<24} {start * 1000:>8.1f} +{duration * 1000:>8.1f}  [{thread}]"
+                    )
+            lines.append("  milestones:")
+            for name, at in sorted(self._marks.items(), key=lambda e: e[1]):
+                lines.append(f"    {name:<24} {at * 1000:>8.1f}")
+        return "\n".join(lines)
+
+
+_startup_report = StartupReport()
+
+
+class _LazyModule(types.ModuleType):
+    """Proxy di un modulo importato solo al primo accesso a un attributo.
+
+    `lazy_import("PIL.Image")` si comporta come `import PIL.Image`: restituisce
+    il package radice, con il sottomodulo già importato al primo utilizzo.
+    """
+
+    def __init__(self, target: str) -> None:
+        super().__init__(target.split(".")[0])
+        self._lazy_target = target
+        self._lazy_module = None
+        self._lazy_lock = threading.Lock()
+
+    def _load(self) -> types.ModuleType:
+        with self._lazy_lock:
+            if self._lazy_module is None:
+                with _startup_report.timed_import(self._lazy_target):
+                    importlib.import_module(self._lazy_target)
+                self._lazy_module = sys.modules[self.__name__]
+        return self._lazy_module
+
+    def __getattr__(self, attr: str):
+        module = self._lazy_module or self._load()
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    if name in sys.modules:
+        return sys.modules[name.split(".")[0]]
+    return _LazyModule(name)
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import itertools
+import os
+from pathlib import Path
+import threading
+import time
+from typing import BinaryIO, Callable, TypeVar
+
+from core import string_utils
+from core.image_utils import save_pic
+from core.logger import _logger
+from core.startup import lazy_import
+
+PIL = lazy_import("PIL.Image")
+
+_T = TypeVar("_T")
+
+# fogli grandi composti a strisce: nessun codificatore JPEG a scansione disponibile
+STREAM_EXTENSION = "png"
+
+
+class PhotoStorage:
+    """Salva i fogli in sottocartelle per data (`YYYY/MM/DD`) con nomi univoci.
+
+    I nomi derivano da un contatore in memoria inizializzato una sola volta
+    all'avvio: la cartella non viene mai scansionata per trovare un nome libero.
+    """
+
+    def __init__(self, root: Path, prefix: str, extension: str) -> None:
+        self._root = Path(root)
+        self._prefix = prefix
+        self._extension = extension
+        self._extensions = (extension, STREAM_EXTENSION)
+        self._lock = threading.Lock()
+        self._shards: set[Path] = set()
+        self._counter = itertools.count(self._seed())
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    def is_sheet(self, filename: str) -> bool:
+        """Vero per i nomi dei fogli salvati, in tutti i formati."""
+        return self._counter_of(filename) is not None
+
+    def is_derived(self, filename: str, extensions: tuple[str, ...]) -> bool:
+        """Vero per i file con il nome di un foglio e una delle estensioni indicate."""
+        return self._counter_of(filename, extensions) is not None
+
+    def _counter_of(self, filename: str, extensions: tuple[str, ...] = ()) -> int | None:
+        for extension in extensions or self._extensions:
+            counter = string_utils.parse_photo_counter(filename, self._prefix, extension)
+            if counter is not None:
+                return counter
+        return None
+
+    def _shard(self, when: time.struct_time) -> Path:
+        return self._root / time.strftime("%Y/%m/%d", when)
+
+    def _seed(self) -> int:
+        # unica scansione, all'avvio: si riparte dopo il contatore più alto di oggi
+        shard = self._shard(time.localtime())
+        if not shard.is_dir():
+            return 1
+        counters = (self._counter_of(entry.name) for entry in os.scandir(shard))
+        return max((c for c in counters if c is not None), default=0) + 1
+
+    def _ensure_shard(self, shard: Path) -> None:
+        if shard not in self._shards:
+            shard.mkdir(parents=True, exist_ok=True)
+            self._shards.add(shard)
+
+    def reserve(self, extension: str | None = None) -> tuple[Path, BinaryIO]:
+        """Crea in modo esclusivo un nuovo file e lo restituisce aperto in scrittura."""
+        when = time.localtime()
+        shard = self._shard(when)
+        with self._lock:
+            self._ensure_shard(shard)
+            while True:
+                name = string_utils.photo_filename(
+                    self._prefix, when, next(self._counter), extension or self._extension
+                )
+                path = shard / name
+                try:
+                    fd = os.open(
+                        path,
+                        os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0),
+                    )
+                except FileExistsError:
+                    # scritto da un'altra istanza: il contatore va semplicemente avanti
+                    _logger.debug(f"{path} already exists, skipping")
+                    continue
+                return path, os.fdopen(fd, "wb")
+
+    def save(self, image: PIL.Image.Image) -> Path:
+        _, path = self.save_with(lambda file: save_pic(image, file, self._extension))
+        return path
+
+    def save_with(
+        self, write: Callable[[BinaryIO], _T], extension: str | None = None
+    ) -> tuple[_T, Path]:
+        """Nuovo file scritto da `write`; in caso di errore il file viene eliminato."""
+        path, file = self.reserve(extension)
+        try:
+            with file:
+                result = write(file)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        return result, path
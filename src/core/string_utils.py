@@ -1,13 +1,16 @@
-from pathlib import Path
 import time
 
 
-def generate_valid_filename(path: Path, prefix: str = "", extension: str = "") -> Path:
-    filename = Path(f"{prefix}{time.strftime('%Y%m%d_%H%M%S')}.{extension}")
-    count: int = 1
-    while (path / filename).exists() and (path / filename).is_file():
-        name = filename.stem.rsplit('_', 1)[0] if count > 1 else filename.stem
-        new_name: str = f"{name}_{count}{filename.suffix}"
-        filename = filename.with_name(new_name)
-        count += 1
-    return path / filename
+def photo_filename(
+    prefix: str, when: time.struct_time, counter: int, extension: str
+) -> str:
+    return f"{prefix}{time.strftime('%Y%m%d_%H%M%S', when)}_{counter:04d}.{extension}"
+
+
+def parse_photo_counter(filename: str, prefix: str, extension: str) -> int | None:
+    """Estrae il contatore da un nome generato con `photo_filename`."""
+    if not filename.startswith(prefix) or not filename.endswith(f".{extension}"):
+        return None
+    stem = filename[len(prefix) : -len(extension) - 1]
+    _, sep, counter = stem.rpartition("_")
+    return int(counter) if sep and counter.isdigit() else None
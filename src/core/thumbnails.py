@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+import threading
+
+from core.config import _config
+from core.logger import _logger
+from core.startup import lazy_import
+from core.utils import lower_thread_priority
+
+PIL = lazy_import("PIL.Image")
+
+
+class ThumbnailCache:
+    """Miniature dei fogli in più dimensioni, generate in background a bassa priorità.
+
+    Le miniature di `photos/2025/06/18/foto.jpg` finiscono in
+    `<root>/<lato>/2025/06/18/foto.jpg`.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        source_root: Path,
+        sizes: list[int] = _config.get("gallery.thumbnails.sizes", [160, 480]),
+        quality: int = _config.get("gallery.thumbnails.quality", 80),
+        niceness: int = _config.get("gallery.niceness", 10),
+    ) -> None:
+        self._root = Path(root)
+        self._source_root = Path(source_root)
+        self._sizes = sorted(sizes, reverse=True)
+        self._quality = quality
+        self._lock = threading.Lock()
+        self._pending: dict[Path, Future] = {}
+        self._pool = ThreadPoolExecutor(
+            1,
+            thread_name_prefix="Thumbnails",
+            initializer=partial(lower_thread_priority, niceness),
+        )
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    @property
+    def sizes(self) -> list[int]:
+        return list(self._sizes)
+
+    def path(self, sheet: Path, size: int) -> Path:
+        relative = Path(sheet).relative_to(self._source_root)
+        return self._root / str(size) / relative.with_suffix(".jpg")
+
+    def schedule(self, sheet: Path, image: PIL.Image.Image | None = None) -> Future:
+        """Accoda la generazione delle miniature di un foglio appena salvato.
+
+        Con `image` (il foglio o la sua anteprima già in memoria) il file non
+        viene decodificato.
+        """
+        sheet = Path(sheet)
+        with self._lock:
+            future = self._pending.get(sheet)
+            if future is None:
+                future = self._pool.submit(self._generate, sheet, image)
+                self._pending[sheet] = future
+                future.add_done_callback(lambda _: self._forget(sheet))
+        return future
+
+    def _forget(self, sheet: Path) -> None:
+        with self._lock:
+            self._pending.pop(sheet, None)
+
+    def get(self, sheet: Path, size: int) -> Path:
+        """Percorso della miniatura, generandola se manca (attende il worker)."""
+        path = self.path(sheet, size)
+        if not path.exists():
+            self.schedule(sheet).result()
+        return path
+
+    def _open(self, sheet: Path) -> PIL.Image.Image:
+        with PIL.Image.open(sheet) as image:
+            largest = self._sizes[0]
+            # per i JPEG la decodifica avviene direttamente a scala ridotta
+            image.draft("RGB", (largest, largest))
+            return image.convert("RGB")
+
+    def _generate(self, sheet: Path, image: PIL.Image.Image | None = None) -> None:
+        try:
+            image = self._open(sheet) if image is None else image.convert("RGB")
+            for size in self._sizes:
+                factor = min(image.size) // (size * 2)
+                if factor > 1:
+                    image = image.reduce(factor)
+                image.thumbnail((size, size), PIL.Image.Resampling.BILINEAR)
+                path = self.path(sheet, size)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                image.save(path, "JPEG", quality=self._quality)
+        except (OSError, ValueError) as e:
+            _logger.warning(f"Can't generate thumbnails for {sheet}: {e}")
+            raise
+
+    def stop(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
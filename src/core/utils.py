@@ -1,6 +1,19 @@
 from enum import StrEnum
+import os
+import platform
+import threading
 
 
 class System(StrEnum):
     WINDOWS = "Windows"
     LINUX = "Linux"
+
+
+def lower_thread_priority(niceness: int) -> None:
+    """Abbassa la priorità del thread corrente (solo Linux, dove ogni thread ha un proprio nice)."""
+    if platform.system() != System.LINUX or niceness <= 0:
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), niceness)
+    except (AttributeError, OSError):
+        pass
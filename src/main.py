@@ -1,11 +1,10 @@
-import rich
 from core.app import app_factory
 
-rich.print("The author of this system is https://github.com/Mova801\n")
+print("The author of this system is https://github.com/Mova801\n")
 
 """
 TODO:
- - se dopo tot minuti nessuno usa il photoboot la camera/la stampante vengono sospese
+ - se dopo tot minuti nessuno usa il photoboot la stampante viene sospesa
  - implementare threading
 """
 